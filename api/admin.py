@@ -3,6 +3,8 @@ from flask_jwt_extended import current_user, jwt_required
 from flask_restx import Namespace, Resource, fields
 from werkzeug.security import generate_password_hash
 
+from api.libs.user_cache import user_identities
+from api.model.search import index_user
 from api.model.enum.enums import UserRole
 from api.model.user import User
 from database import db
@@ -79,5 +81,7 @@ class AdminUsersShow(Resource):
         user.email = params["email"]
 
         user.password = generate_password_hash(params["password"], method='sha256')
+        index_user(user)
         db.session.commit()
+        user_identities.invalidate(user.id)
         return {"message": "Successfully updated the user's information"}, 200
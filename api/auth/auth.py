@@ -1,10 +1,6 @@
-import os
-import re
 import traceback
-from datetime import datetime, timezone
 from uuid import uuid4
 
-import boto3
 from flask import request, jsonify
 from flask_jwt_extended import (
     create_access_token,
@@ -16,10 +12,13 @@ from flask_jwt_extended import (
 from flask_restx import Resource, fields, Namespace
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from api.libs.avatar import delete_avatar
+from api.libs.password import PasswordBusyException, password_limiter
 from api.model.confirmation import Confirmation, UpdateEmail
-from api.model.others import TokenBlocklist
+from api.libs.token_revocation import revoke_token
+from api.libs.user_cache import user_identities
+from api.model.search import index_user
 from api.model.user import User
-from api.libs.mailgun import MailGunException
 from database import db
 
 auth_ns = Namespace('/auth', description="* Authentication")
@@ -91,14 +90,14 @@ class AuthBasic(Resource):
 
         try:
             user.save_to_db()
+            index_user(user)
             confirmation = Confirmation(user.id)
-            confirmation.save_to_db()
+            db.session.add(confirmation)
+            db.session.flush()
             user.send_confirmation_email()
+            db.session.commit()
             return {'message': 'Account created successfully. '
                                'an email with activation link has been sent to your email address, please check.'}, 201
-        except MailGunException as e:
-            user.delete_from_db()
-            return {"message": str(e)}, 400
         except:
             traceback.print_exc()
             user.delete_from_db()
@@ -120,7 +119,9 @@ class AuthBasic(Resource):
         current_user.nickname = params['nickname']
         current_user.nickname_replaced = params['nickname'].replace(' ', '').replace('　', '')
         current_user.introduce = params['introduce']
+        index_user(current_user)
         db.session.commit()
+        user_identities.invalidate(current_user.id)
 
         return {'message': 'the user was successfully updated.'}, 201
 
@@ -130,24 +131,14 @@ class AuthBasic(Resource):
     )
     @jwt_required()
     def delete(self):
-
-        try:
-            client = boto3.client("s3")
-            # delete the avatar from aws s3
-            if "egg" not in current_user.avatar:
-                client.delete_object(
-                    Bucket=os.getenv("AWS_BUCKET_NAME"),
-                    Key=f'{os.getenv("AWS_PATH_KEY")}{current_user.avatar}'
-                )
-        except:
-            return {"message": "Internal server error. Failed to delete the user."}, 500
+        # queue the avatar (all the variants) to delete from aws s3
+        delete_avatar(current_user.avatar)
 
         # change True the current_user deleted flag, and revoke jwt.
         current_user.is_deleted = True
-        jti = get_jwt()["jti"]
-        now = datetime.now(timezone.utc)
-        db.session.add(TokenBlocklist(jti=jti, created_at=now))
+        revoke_token(get_jwt())
         db.session.commit()
+        user_identities.invalidate(current_user.id)
 
         return {'message': 'the user was successfully deleted. And token revoked'}, 200
 
@@ -164,15 +155,16 @@ class AuthLogin(Resource):
         params = request.json
         identify = params['username_or_email']
 
-        user = None
-        if re.fullmatch(username_regex, identify):
-            user = User.query.filter_by(username=identify).one_or_none()
-        elif re.fullmatch(email_regex, identify):
-            user = User.query.filter_by(email=identify).one_or_none()
+        # the pattern was validated on signup, so an exact match is enough.
+        user = User.find_for_login(identify) if type(identify) is str else None
 
-        if user and not user.is_deleted and check_password_hash(user.password, params['password']):
-            confirmation = user.most_recent_confirmation
-            if confirmation and confirmation.confirmed:
+        try:
+            verified = user and not user.is_deleted and password_limiter.check(user.password, params['password'])
+        except PasswordBusyException as e:
+            return {"message": str(e), "user_id_not_confirmed": None}, 503
+
+        if verified:
+            if user.confirmed_at:
                 access_token = create_access_token(identity=user)
                 refresh_token = create_refresh_token(identity=user)
                 return jsonify(access_token=access_token, refresh_token=refresh_token)
@@ -192,9 +184,7 @@ class AuthLogout(Resource):
     )
     @jwt_required()
     def delete(self):
-        jti = get_jwt()["jti"]
-        now = datetime.now(timezone.utc)
-        db.session.add(TokenBlocklist(jti=jti, created_at=now))
+        revoke_token(get_jwt())
         db.session.commit()
         return jsonify(message="Logged out completely.")
 
@@ -211,11 +201,15 @@ class AuthPasswordUpdate(Resource):
     @jwt_required()
     def put(self):
         params = request.json
-        if not check_password_hash(current_user.password, params['current_password']):
-            return {"message": "Incorrect current password."}, 400
+        try:
+            if not password_limiter.check(current_user.password, params['current_password']):
+                return {"message": "Incorrect current password."}, 400
+        except PasswordBusyException as e:
+            return {"message": str(e)}, 503
 
         current_user.password = generate_password_hash(params['new_password'], method='sha256')
         db.session.commit()
+        user_identities.invalidate(current_user.id)
         return {"message": "The password was successfully updated."}, 200
 
 
@@ -273,8 +267,9 @@ class AuthConfirmation(Resource):
         if confirmation.is_expired:
             return {"message": "expired"}, 401
 
-        confirmation.confirmed = True
+        confirmation.user.confirm(confirmation)
         db.session.commit()
+        user_identities.invalidate(confirmation.user_id)
 
         # redirect to Frontend page.
         return {"message": "You are confirmed now."}, 200
@@ -300,12 +295,11 @@ class AuthConfirmationResend(Resource):
                 confirmation.force_to_expire()
             new_confirmation = Confirmation(user_id)
             db.session.add(new_confirmation)
-            db.session.commit()
+            db.session.flush()
             user.send_confirmation_email()
+            db.session.commit()
             return {"message": "E-mail confirmation successfully re-sent. please check your email"
                                f" <{user.email}>"}
-        except MailGunException as e:
-            return {"message": str(e)}, 400
         except:
             traceback.print_exc()
             return {"message": "Internal server error. Failed to resend the email."}, 500
@@ -330,12 +324,12 @@ class AuthUpdateEmail(Resource):
             if old_update_email_confirmation:
                 old_update_email_confirmation.force_to_expire()  # important
             new_update_email_confirmation = UpdateEmail(current_user.id, request.json["email"])
-            new_update_email_confirmation.save_to_db()
+            db.session.add(new_update_email_confirmation)
+            db.session.flush()
             current_user.send_update_confirmation_email()
+            db.session.commit()
             return {'message': 'An email with code '
                                'has been sent to your email address, please check.'}, 201
-        except MailGunException as e:
-            return {"message": str(e)}, 400
         except:
             traceback.print_exc()
             return {"message": "Internal server error. Failed to resend the email."}, 500
@@ -363,6 +357,7 @@ class AuthUpdateEmail(Resource):
         current_user.email = update_email.email
         update_email.force_to_expire()  # important
         db.session.commit()
+        user_identities.invalidate(current_user.id)
 
         return {"message": "Your email has been updated successfully."}, 200
 
@@ -384,9 +379,8 @@ class AuthPasswordReset(Resource):
             token = uuid4().hex
             user.create_reset_password_resource(token)
             user.send_reset_password_email(token)
+            db.session.commit()
             return {"message": "An email with link has been sent to your email address, please check."}, 200
-        except MailGunException as e:
-            return {"message": str(e)}, 400
         except:
             traceback.print_exc()
             return {"message": "Internal server error. Failed to resend the email."}, 500
@@ -423,5 +417,6 @@ class AuthPasswordReset(Resource):
         user.password = generate_password_hash(password, method='sha256')
         db.session.commit()
         user.force_to_expired()
+        user_identities.invalidate(user.id)
 
         return {"message": "Reset a password successfully."}, 200
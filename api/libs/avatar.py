@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image
+
+from api.libs.s3 import S3
+from api.model.outbox import enqueue_object_deletions
+
+"""
+Avatar image processing.
+The uploaded image is decoded once in a pool process, and every variant is rendered from it and uploaded to S3
+there, so the web workers only read the header and submit the job.
+"avatar" of the user keeps the name of the default variant (ex: "20220101_000000_0000001.png"), and the others
+are named after it. (ex: "20220101_000000_0000001_80.webp")
+The clients upload the original to a staging key by a presigned POST, so the bytes don't pass the web workers;
+the pool reads it from S3. (the staging objects are deleted after processing)
+"""
+
+AVATAR_WIDTH = 170  # the default variant. (png)
+AVATAR_VARIANT_WIDTHS = [80, 170, 340]
+AVATAR_FORMATS = {"png": ("PNG", "image/png"), "webp": ("WEBP", "image/webp")}
+
+
+class AvatarException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+def avatar_keys(filename: str) -> list[str]:
+    """S3 keys of all the variants of the avatar."""
+    base = filename.rsplit(".", 1)[0]
+    keys = []
+    for width in AVATAR_VARIANT_WIDTHS:
+        for extension in AVATAR_FORMATS:
+            suffix = "" if width == AVATAR_WIDTH else f"_{width}"
+            keys.append(f'{os.getenv("AWS_PATH_KEY")}{base}{suffix}.{extension}')
+    return keys
+
+
+def delete_avatar(filename: str) -> None:
+    """Queue all the variants of the avatar to delete from S3, in the current transaction.
+    (not the default "egg" avatars)
+    """
+    if "egg" in filename:
+        return
+    enqueue_object_deletions(avatar_keys(filename))
+
+
+def staging_key(user_id: int, upload_id: str) -> str:
+    """S3 key of an original uploaded by the user. (not public)
+    the uploads never confirmed are left, so expire the "staging/" prefix by a lifecycle rule of the bucket.
+    """
+    return f'{os.getenv("AWS_PATH_KEY")}staging/{user_id}/{upload_id}'
+
+
+def presign_upload(user_id: int, upload_id: str, max_bytes: int, expires_seconds: int) -> dict:
+    """Presigned POST (url and form fields) to upload an image of up to max_bytes to the staging key."""
+    return S3.get_client().generate_presigned_post(
+        Bucket=S3.AWS_BUCKET_NAME,
+        Key=staging_key(user_id, upload_id),
+        Conditions=[["content-length-range", 1, max_bytes], ["starts-with", "$Content-Type", "image/"]],
+        ExpiresIn=expires_seconds
+    )
+
+
+def check_image(data: bytes, max_pixels: int) -> None:
+    """Check the format and dimensions from the header only. (before the full decode in the pool)"""
+    try:
+        image = Image.open(BytesIO(data))
+    except Exception:
+        raise AvatarException("Unsupported image.")
+    if image.width * image.height > max_pixels:
+        raise AvatarException("The image is too large.")
+
+
+def render_staged_avatar(key: str, filename: str, max_pixels: int) -> str:
+    """Read the staged original from S3 and render it. (runs in the pool process)"""
+    data = S3.get_client().get_object(Bucket=S3.AWS_BUCKET_NAME, Key=key)["Body"].read()
+    check_image(data, max_pixels)
+    return render_avatar(data, filename, max_pixels)
+
+
+def render_avatar(data: bytes, filename: str, max_pixels: int) -> str:
+    """Decode the image once, and upload all the variants. (runs in the pool process)"""
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    image = Image.open(BytesIO(data))
+    # decode JPEG at a reduced scale directly. (no effect on the others)
+    image.draft(image.mode, (max(AVATAR_VARIANT_WIDTHS), max(AVATAR_VARIANT_WIDTHS)))
+    image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    client = S3.get_client()
+    base = filename.rsplit(".", 1)[0]
+    for width in sorted(AVATAR_VARIANT_WIDTHS, reverse=True):
+        variant = scale_to_width(image=image, width=width)
+        for extension, (image_format, content_type) in AVATAR_FORMATS.items():
+            buffer = BytesIO()
+            variant.save(buffer, image_format)
+            buffer.seek(0)
+            suffix = "" if width == AVATAR_WIDTH else f"_{width}"
+            client.upload_fileobj(
+                Fileobj=buffer,
+                Bucket=S3.AWS_BUCKET_NAME,
+                Key=f'{os.getenv("AWS_PATH_KEY")}{base}{suffix}.{extension}',
+                ExtraArgs={"ACL": "public-read", "ContentType": content_type}
+            )
+    return filename
+
+
+# Sustain aspect ratio.
+def scale_to_width(image, width):
+    height = round(image.height * width / image.width)
+    return image.resize((width, height))
+
+
+def pool_context():
+    """Start method of the pool processes: forked from a clean server process, not from the web worker.
+    (a fork of the multithreaded web worker can inherit a lock held by another thread and deadlock)
+    """
+    context = multiprocessing.get_context("forkserver")
+    # under uWSGI, sys.executable is the uwsgi binary, not the interpreter.
+    if not os.path.basename(sys.executable).startswith("python"):
+        context.set_executable(os.path.join(sys.exec_prefix, "bin", "python3"))
+    return context
+
+
+class AvatarPool:
+    """Bounded process pool of the avatar jobs. (created lazily in each web worker)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+
+    def submit(self, config: dict, callback, job, *args) -> bool:
+        """Submit job(*args). False if the pool is full. callback(future) is called in a thread of this process."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=config['AVATAR_PROCESS_WORKERS'],
+                                                     mp_context=pool_context())
+                self._slots = threading.BoundedSemaphore(config['AVATAR_MAX_PENDING_JOBS'])
+        if not self._slots.acquire(blocking=False):
+            return False
+
+        def done(future: Future) -> None:
+            self._slots.release()
+            callback(future)
+
+        try:
+            future = self.submit_job(config, job, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(done)
+        return True
+
+    def submit_job(self, config: dict, job, *args) -> Future:
+        """Submit to the executor. A broken one (ex: a process killed by OOM) is replaced and retried once."""
+        executor = self._executor
+        try:
+            return executor.submit(job, *args)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = ProcessPoolExecutor(max_workers=config['AVATAR_PROCESS_WORKERS'],
+                                                         mp_context=pool_context())
+                    executor.shutdown(wait=False)
+            return self._executor.submit(job, *args)
+
+
+avatar_pool = AvatarPool()
@@ -1,7 +1,11 @@
+import json
 import os
 
-from flask import Response
-from requests import post
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+MAILGUN_BATCH_SIZE = 1000  # max recipients of a batch sending.
 
 
 class MailGunException(Exception):
@@ -12,23 +16,45 @@ class MailGunException(Exception):
 class MailGun:
     MAILGUN_API_KEY = os.getenv("MAILGUN_API_KEY")
     MAILGUN_DOMAIN_NAME = os.getenv("MAILGUN_DOMAIN_NAME")
+    # can be a local stub server. (ex: "http://localhost:8025/v3")
+    MAILGUN_API_BASE = os.getenv("MAILGUN_API_BASE", "https://api.mailgun.net/v3")
+    MAILGUN_TIMEOUT = 10  # seconds
+
+    _session: Session = None
+
+    @classmethod
+    def get_session(cls) -> Session:
+        """Keep-alive session of the process, retrying the transient errors with backoff."""
+        if cls._session is None:
+            # a read error may be after the message was accepted, so it's not retried. (no duplicated emails)
+            retry = Retry(total=3, read=0, backoff_factor=0.5, status_forcelist=[429, 503], allowed_methods=["POST"])
+            session = Session()
+            session.mount("https://", HTTPAdapter(max_retries=retry))
+            session.mount("http://", HTTPAdapter(max_retries=retry))
+            cls._session = session
+        return cls._session
 
     @classmethod
     def send_email(cls, email: list[str], subject: str, text: str, html: str) -> Response:
+        """Send the message to up to MAILGUN_BATCH_SIZE recipients by one request.
+        (recipient-variables make it a batch sending, so each recipient sees only own address.)
+        """
 
         if cls.MAILGUN_API_KEY is None:
             raise MailGunException("Failed to load MailGun API key.")
         if cls.MAILGUN_DOMAIN_NAME is None:
             raise MailGunException("Failed to load MailGun domain name.")
 
-        response = post(
-            f"https://api.mailgun.net/v3/{cls.MAILGUN_DOMAIN_NAME}/messages",
+        response = cls.get_session().post(
+            f"{cls.MAILGUN_API_BASE}/{cls.MAILGUN_DOMAIN_NAME}/messages",
             auth=("api", cls.MAILGUN_API_KEY),
             data={"from": f"Enqueter <not-reply@{cls.MAILGUN_DOMAIN_NAME}>",
                   "to": email,
                   "subject": subject,
                   "text": text,
-                  "html": html}
+                  "html": html,
+                  "recipient-variables": json.dumps(dict(map(lambda x: (x, {}), email)))},
+            timeout=cls.MAILGUN_TIMEOUT
         )
 
         if response.status_code != 200:
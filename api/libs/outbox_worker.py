@@ -0,0 +1,165 @@
+from botocore.exceptions import BotoCoreError, ClientError
+from flask import current_app
+from requests import RequestException
+
+from api.libs.mailgun import MailGun, MailGunException, MAILGUN_BATCH_SIZE
+from api.libs.s3 import S3
+from api.model.aggregate import record_point, record_response
+from api.model.enum.enums import NotificationCategory
+from api.model.others import Notification, user_relationship
+from api.model.outbox import claim_events, delete_event, bury_event, claim_emails, renew_email_claim, \
+    delete_emails, put_off_emails, claim_object_deletions, delete_object_deletions, put_off_object_deletions, \
+    OUTBOX_ANSWER_CREATED, OUTBOX_USER_FOLLOWED, OUTBOX_USER_UNFOLLOWED
+from api.model.question import Question
+from api.model.timeline import backfill_timeline, trim_timeline
+from api.model.user import User, UserCounters, PointStats, ResponseStats
+from database import db
+
+
+def answer_created(user_id: int, question_id: int, question_user_id: int, result_point: int) -> None:
+    user = User.find_by_id(user_id)
+    if not user:
+        return
+    # the question deleted before this event: the answer went with it, so nothing is counted.
+    question = Question.find_by_id(question_id)
+    if question:
+        record_point(user_id, result_point)
+        PointStats.apply(user_id, result_point)
+        UserCounters.add(user_id, answers=1)
+        record_response(question_user_id)
+        ResponseStats.apply(question_user_id, 1)
+        user.create_answer_notification(question)
+
+
+def user_followed(user_id: int, followed_id: int) -> None:
+    user = User.find_by_id(user_id)
+    followed_user = User.find_by_id(followed_id)
+    if not user or not followed_user:
+        return
+    UserCounters.add(user_id, followings=1)
+    UserCounters.add(followed_id, followers=1)
+
+    # unfollowed before this event. (the unfollow event trims the timeline after this anyway)
+    is_following = db.session.query(user_relationship.c.following_id) \
+        .filter(user_relationship.c.following_id == user_id) \
+        .filter(user_relationship.c.followed_id == followed_id) \
+        .first()
+    if is_following:
+        backfill_timeline(user_id, followed_id)
+        user.create_follow_notification(followed_user)
+
+
+def user_unfollowed(user_id: int, followed_id: int) -> None:
+    if not User.find_by_id(user_id) or not User.find_by_id(followed_id):
+        return
+    UserCounters.add(user_id, followings=-1)
+    UserCounters.add(followed_id, followers=-1)
+    trim_timeline(user_id, followed_id)
+
+    # delete notification if exist
+    query = Notification.query.filter_by(passive_id=followed_id, active_id=user_id,
+                                         category=NotificationCategory.follow)
+    unread_count: int = query.filter_by(watched=False).delete(synchronize_session=False)
+    query.delete(synchronize_session=False)
+    if unread_count:
+        UserCounters.add(followed_id, unread_notifications=-unread_count)
+
+
+OUTBOX_HANDLERS = {
+    OUTBOX_ANSWER_CREATED: answer_created,
+    OUTBOX_USER_FOLLOWED: user_followed,
+    OUTBOX_USER_UNFOLLOWED: user_unfollowed,
+}
+
+
+def drain_outbox() -> int:
+    """Claim a batch of the outbox events and handle them one by one. (each in its own transaction)
+    :return: count of the claimed events.
+    """
+    config = current_app.config
+    worker_id, events = claim_events(config['OUTBOX_BATCH_SIZE'], config['OUTBOX_LEASE_SECONDS'])
+    for event in events:
+        try:
+            # deleted first, so the side effects are committed only by the worker holding the claim.
+            if not delete_event(event.id, worker_id):
+                db.session.rollback()
+                current_app.logger.warning(f"The outbox event {event.id} was claimed by another worker. skipped.")
+                continue
+            OUTBOX_HANDLERS[event.topic](**event.payload)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if event.attempts < config['OUTBOX_MAX_ATTEMPTS']:
+                current_app.logger.exception(f"Failed the outbox event {event.id} ({event.topic}). retry later.")
+                continue
+            current_app.logger.exception(f"Gave up the outbox event {event.id} ({event.topic}). kept as dead.")
+            bury_event(event.id, worker_id)
+            db.session.commit()
+    return len(events)
+
+
+def drain_email_outbox() -> int:
+    """Claim a batch of the emails and send them one by one. (each email is personalized, so nothing to merge)
+    The lease is renewed before each email, so a slow batch isn't claimed by another worker while sending,
+    and an email whose claim was taken over is skipped. Each email is committed (deleted or put off) on its own.
+    :return: count of the claimed emails.
+    """
+    config = current_app.config
+    worker_id, emails = claim_emails(config['EMAIL_OUTBOX_BATCH_SIZE'], config['OUTBOX_LEASE_SECONDS'])
+    for email in emails:
+        if not renew_email_claim(email.id, worker_id):
+            current_app.logger.warning(f"The email {email.id} was claimed by another worker. skipped.")
+            continue
+        try:
+            # split only when the email has more recipients than a request.
+            for start in range(0, len(email.recipients), MAILGUN_BATCH_SIZE):
+                MailGun.send_email(email.recipients[start:start + MAILGUN_BATCH_SIZE],
+                                   email.subject, email.text, email.html)
+            delete_emails([email.id], worker_id)
+        except (MailGunException, RequestException):
+            if email.attempts < config['EMAIL_OUTBOX_MAX_ATTEMPTS']:
+                current_app.logger.exception(f"Failed to send the email {email.id}. retry later.")
+                put_off_emails([email.id], worker_id,
+                               config['EMAIL_OUTBOX_BACKOFF_SECONDS'] * 2 ** (email.attempts - 1))
+            else:
+                current_app.logger.exception(f"Gave up the email {email.id}.")
+                delete_emails([email.id], worker_id)
+        db.session.commit()
+    return len(emails)
+
+
+def drain_object_deletions() -> int:
+    """Claim a batch of the S3 keys and delete them by delete_objects. the failed keys are retried with backoff.
+    :return: count of the claimed keys.
+    """
+    config = current_app.config
+    worker_id, deletions = claim_object_deletions(config['OBJECT_DELETION_BATCH_SIZE'], config['OUTBOX_LEASE_SECONDS'])
+    if not deletions:
+        return 0
+
+    try:
+        failed_keys: set[str] = set(S3.delete_objects(list(map(lambda x: x.key, deletions))))
+    except (BotoCoreError, ClientError):
+        current_app.logger.exception(f"Failed to delete {len(deletions)} objects.")
+        failed_keys = set(map(lambda x: x.key, deletions))
+
+    deleted_ids, retried, given_up = [], [], []
+    for deletion in deletions:
+        if deletion.key not in failed_keys:
+            deleted_ids.append(deletion.id)
+        elif deletion.attempts < config['OBJECT_DELETION_MAX_ATTEMPTS']:
+            retried.append(deletion)
+        else:
+            given_up.append(deletion)
+
+    if given_up:
+        current_app.logger.error(f"Gave up deleting the objects {list(map(lambda x: x.key, given_up))}.")
+        deleted_ids += list(map(lambda x: x.id, given_up))
+    if deleted_ids:
+        delete_object_deletions(deleted_ids, worker_id)
+    if retried:
+        attempts: int = max(map(lambda x: x.attempts, retried))
+        put_off_object_deletions(list(map(lambda x: x.id, retried)), worker_id,
+                                 config['OBJECT_DELETION_BACKOFF_SECONDS'] * 2 ** (attempts - 1))
+    db.session.commit()
+    return len(deletions)
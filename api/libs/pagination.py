@@ -0,0 +1,102 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import DateTime, and_, or_
+
+DEFAULT_LIMIT = 15
+MAX_LIMIT = 50
+
+# for the swagger document.
+CURSOR_PARAMS = {
+    'after': {'type': 'str', 'description': 'next_cursor of the previous page.'},
+    'limit': {'type': 'int'},
+    'with_total': {'type': 'bool'}
+}
+
+
+class CursorException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+"""
+Keyset (cursor) pagination.
+Rows are ordered by the key columns descending, and the opaque "after" cursor holds the key of the last row,
+so every page is a range scan from the cursor. (no OFFSET and no COUNT(*) unless "with_total" is requested.)
+"""
+
+
+def is_cursor_request() -> bool:
+    return "after" in request.args or "limit" in request.args
+
+
+def get_cursor_args() -> tuple:
+    """(after, limit, with_total) from the query string."""
+    after = request.args.get("after") or None
+    try:
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise CursorException("Invalid limit.")
+    limit = min(max(limit, 1), MAX_LIMIT)
+    with_total = request.args.get("with_total") in ["1", "true"]
+    return after, limit, with_total
+
+
+def encode_cursor(values: list) -> str:
+    values = list(map(lambda x: x.isoformat() if isinstance(x, datetime) else x, values))
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not type(values) is list or not len(values) == len(columns):
+            raise ValueError
+        return list(map(lambda x: datetime.fromisoformat(x[1]) if isinstance(x[0].type, DateTime) else x[1],
+                        zip(columns, values)))
+    except (ValueError, TypeError):
+        raise CursorException("Invalid cursor.")
+
+
+def keyset_before(columns: list, values: list):
+    """(columns) < (values) in the descending order. expanded for the index to be used."""
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column < value
+    return or_(column < value, and_(column == value, keyset_before(columns[1:], values[1:])))
+
+
+def paginate_by_cursor(query, columns: list, key, after: str or None, limit: int, with_total: bool = False) -> dict:
+    """Get the page after the cursor.
+    :param columns: key columns. (ex: [Question.id] or [answer.c.created_at, answer.c.question_id])
+    :param key: function to get the key values from a row.
+    :return: {"objects": rows, "next_cursor": str or None, ("total": int)}
+    """
+    result = {}
+    if with_total:
+        result["total"] = query.order_by(None).count()
+
+    if after:
+        query = query.filter(keyset_before(columns, decode_cursor(after, columns)))
+
+    objects = query.order_by(None).order_by(*map(lambda x: x.desc(), columns)).limit(limit + 1).all()
+    has_next = len(objects) > limit
+    objects = objects[:limit]
+
+    return result | {
+        "objects": objects,
+        "next_cursor": encode_cursor(key(objects[-1])) if has_next else None
+    }
+
+
+def cursor_response(query, columns: list, key, serialize) -> tuple:
+    """Response of the cursor mode. {"data": [...], "next_cursor": str or None, ("total": int)}"""
+    try:
+        after, limit, with_total = get_cursor_args()
+        page = paginate_by_cursor(query, columns, key, after, limit, with_total)
+    except CursorException as e:
+        return {"message": str(e)}, 400
+
+    return {"data": serialize(page.pop("objects"))} | page, 200
@@ -0,0 +1,34 @@
+import threading
+
+from flask import current_app
+from werkzeug.security import check_password_hash
+
+
+class PasswordBusyException(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+class PasswordLimiter:
+    """Bounded concurrency of the password hashing in this worker, so a burst of logins can't take all the CPU.
+    (created lazily from the config)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = None
+
+    def check(self, password_hash: str, password: str) -> bool:
+        """check_password_hash in a slot. PasswordBusyException if no slot is free in time."""
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.BoundedSemaphore(current_app.config['PASSWORD_HASH_CONCURRENCY'])
+        if not self._slots.acquire(timeout=current_app.config['PASSWORD_HASH_WAIT_SECONDS']):
+            raise PasswordBusyException("Too many logins now. please try again later.")
+        try:
+            return check_password_hash(password_hash, password)
+        finally:
+            self._slots.release()
+
+
+password_limiter = PasswordLimiter()
@@ -0,0 +1,49 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+S3_DELETE_BATCH_SIZE = 1000  # max keys of a delete_objects request.
+
+
+class S3:
+    AWS_BUCKET_NAME = os.getenv("AWS_BUCKET_NAME")
+    # can be a local S3 compatible server. (ex: "http://localhost:9000")
+    AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+    S3_MAX_POOL_CONNECTIONS = 20
+    S3_MAX_ATTEMPTS = 5
+
+    _lock = threading.Lock()
+    _client = None
+    _pid: int = None
+
+    @classmethod
+    def get_client(cls):
+        """S3 client of the process. (thread safe, keeps the connections alive and retries with backoff)
+        a forked process (ex: the avatar pool) creates its own, not sharing the connections of the parent.
+        """
+        with cls._lock:
+            if cls._client is None or cls._pid != os.getpid():
+                config = Config(max_pool_connections=cls.S3_MAX_POOL_CONNECTIONS,
+                                retries={"max_attempts": cls.S3_MAX_ATTEMPTS, "mode": "standard"})
+                cls._client = boto3.session.Session().client("s3", endpoint_url=cls.AWS_S3_ENDPOINT_URL,
+                                                             config=config)
+                cls._pid = os.getpid()
+            return cls._client
+
+    @classmethod
+    def delete_objects(cls, keys: list[str]) -> list[str]:
+        """Delete the objects by S3_DELETE_BATCH_SIZE keys per request.
+        :return: keys failed to delete. (a missing key is not a failure)
+        """
+        client = cls.get_client()
+        failed_keys: list[str] = []
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            response = client.delete_objects(
+                Bucket=cls.AWS_BUCKET_NAME,
+                Delete={"Objects": list(map(lambda x: {"Key": x}, keys[start:start + S3_DELETE_BATCH_SIZE])),
+                        "Quiet": True}
+            )
+            failed_keys += list(map(lambda x: x["Key"], response.get("Errors", [])))
+        return failed_keys
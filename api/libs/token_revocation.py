@@ -0,0 +1,103 @@
+import threading
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from time import time
+
+from flask import current_app
+from sqlalchemy import func, or_, and_
+
+from api.model.others import TokenBlocklist
+from database import db
+
+
+class RevokedTokenCache:
+    """In-process set of the revoked jtis whose tokens are not expired yet.
+    It is refreshed incrementally by 'token_blocklist.id', at most once per 'JWT_REVOCATION_REFRESH_SECONDS',
+    so checking a token normally needs no database access.
+    InnoDB can commit the auto-increment ids out of order, so each refresh reads again from the high-water mark
+    of 'JWT_REVOCATION_OVERLAP_SECONDS' ago, not the latest one. (deduplicated by jti)
+    A refresh token not in the cache is checked against the database too. (they live long, and are used rarely)
+    (* an access token revoked by another worker is accepted until the next refresh of this worker.)
+    """
+
+    def __init__(self):
+        self._revoked: dict = {}  # {jti: exp (UNIX time)}
+        self._marks: deque = deque()  # [(refreshed_at, high-water mark)]
+        self._refreshed_at: float = 0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti: str, token_type: str = "access") -> bool:
+        if time() - self._refreshed_at > current_app.config['JWT_REVOCATION_REFRESH_SECONDS']:
+            self.refresh()
+        if jti in self._revoked:
+            return True
+        if token_type == "refresh":
+            return db.session.query(TokenBlocklist.id).filter_by(jti=jti).first() is not None
+        return False
+
+    def add(self, jti: str, exp: int) -> None:
+        with self._lock:
+            self._revoked[jti] = exp
+
+    def refresh(self) -> None:
+        with self._lock:
+            if time() - self._refreshed_at <= current_app.config['JWT_REVOCATION_REFRESH_SECONDS']:
+                return
+
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            query = db.session.query(TokenBlocklist.id, TokenBlocklist.jti, TokenBlocklist.created_at,
+                                     TokenBlocklist.expires_at)
+            if not self._marks:
+                # the first time, load only the tokens not expired.
+                max_lifetime = current_app.config['JWT_REFRESH_TOKEN_EXPIRES']
+                query = query.filter(or_(TokenBlocklist.expires_at > now,
+                                         and_(TokenBlocklist.expires_at.is_(None),
+                                              TokenBlocklist.created_at > now - max_lifetime)))
+                high_water_mark = db.session.query(func.coalesce(func.max(TokenBlocklist.id), 0)).scalar()
+                # the ids revoked within the overlap may be committed yet, so read them again. (only once)
+                overlap = timedelta(seconds=current_app.config['JWT_REVOCATION_OVERLAP_SECONDS'])
+                self._marks.append((time() - overlap.total_seconds(),
+                                    db.session.query(func.coalesce(func.max(TokenBlocklist.id), 0))
+                                    .filter(TokenBlocklist.created_at < now - overlap)
+                                    .scalar()))
+                objects = query.all()
+            else:
+                objects = query.filter(TokenBlocklist.id > self._marks[0][1]).all()
+                high_water_mark = self._marks[-1][1]
+
+            for x in objects:
+                self._revoked[x.jti] = get_exp(x.created_at, x.expires_at)
+                high_water_mark = max(high_water_mark, x.id)
+
+            # the oldest mark is the latest one older than the overlap. (the lower bound of the next refresh)
+            self._marks.append((time(), high_water_mark))
+            overlap_from = time() - current_app.config['JWT_REVOCATION_OVERLAP_SECONDS']
+            while len(self._marks) > 1 and self._marks[1][0] <= overlap_from:
+                self._marks.popleft()
+
+            # evict the tokens already expired.
+            now_time = time()
+            self._revoked = dict(filter(lambda x: x[1] > now_time, self._revoked.items()))
+            self._refreshed_at = time()
+
+
+def get_exp(created_at: datetime, expires_at: datetime or None) -> int:
+    """UNIX time of "exp". (old records without expires_at live for the max lifetime of the tokens.)"""
+    if not expires_at:
+        expires_at = created_at + current_app.config['JWT_REFRESH_TOKEN_EXPIRES']
+    return int(expires_at.replace(tzinfo=timezone.utc).timestamp())
+
+
+def revoke_token(jwt_payload: dict) -> None:
+    """Add the token to the blocklist (commit by the caller) and to the cache of this worker."""
+    now = datetime.now(timezone.utc)
+    db.session.add(TokenBlocklist(
+        jti=jwt_payload["jti"],
+        created_at=now,
+        expires_at=datetime.fromtimestamp(jwt_payload["exp"], timezone.utc)
+    ))
+    revoked_tokens.add(jwt_payload["jti"], jwt_payload["exp"])
+
+
+"""global cache of this worker."""
+revoked_tokens = RevokedTokenCache()
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from time import time
+
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from api.model.user import User
+from database import db
+
+
+class UserIdentityCache:
+    """Bounded LRU/TTL cache of user identity snapshots (column values) in this worker.
+    Must be invalidated whenever the user is changed. (the other workers see the change after the TTL.)
+    """
+
+    def __init__(self):
+        self._snapshots: OrderedDict = OrderedDict()  # {user_id: (cached_at, {column: value})}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> dict or None:
+        with self._lock:
+            item = self._snapshots.get(user_id)
+            if item is None:
+                return None
+            if time() - item[0] > current_app.config['USER_CACHE_TTL_SECONDS']:
+                del self._snapshots[user_id]
+                return None
+            self._snapshots.move_to_end(user_id)
+            return item[1]
+
+    def set(self, user_id: int, snapshot: dict) -> None:
+        with self._lock:
+            self._snapshots[user_id] = (time(), snapshot)
+            self._snapshots.move_to_end(user_id)
+            while len(self._snapshots) > current_app.config['USER_CACHE_MAX_SIZE']:
+                self._snapshots.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._snapshots.pop(int(user_id), None)
+
+
+def load_user(user_id: int) -> User or None:
+    """Get the user by the cached snapshot without query. (the relationships are still loaded lazily.)"""
+    snapshot = user_identities.get(user_id)
+    if snapshot is None:
+        user = User.query.filter_by(id=user_id).one_or_none()
+        if user:
+            user_identities.set(user.id, dict(map(lambda x: (x.key, getattr(user, x.key)),
+                                                  User.__mapper__.column_attrs)))
+        return user
+
+    user = User.__mapper__.class_manager.new_instance()
+    for (key, value) in snapshot.items():
+        setattr(user, key, value)
+    # treat as loaded from the database, and attach to the session without query.
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+"""global cache of this worker."""
+user_identities = UserIdentityCache()
@@ -2,19 +2,98 @@
 Used in batch processes.
 """
 
-from datetime import datetime
+from datetime import datetime, date
 
-from sqlalchemy import Integer, ForeignKey, DateTime
+from sqlalchemy import Integer, ForeignKey, DateTime, String, Index, Date, PrimaryKeyConstraint, JSON
+from sqlalchemy.dialects.mysql import insert
 
+from api.model.enum.enums import AnswerResultPoint
 from database import db
 
+# column of point_daily counting each result.
+POINT_CATEGORY_COLUMNS = {
+    AnswerResultPoint.RIGHT: "right_count",
+    AnswerResultPoint.FIRST: "first_count",
+    AnswerResultPoint.WRONG: "wrong_count",
+    AnswerResultPoint.EVEN: "even_count",
+}
+
 point = db.Table('point',
                  db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
                  db.Column('point', Integer, nullable=False),  # right: 3, wrong: -3, even: 0, first: 1
-                 db.Column('created_at', DateTime, nullable=False, default=datetime.now()),
+                 db.Column('created_at', DateTime, nullable=False, default=datetime.now),
+                 Index('point_created_at_index', 'created_at')
                  )
 
 response = db.Table('response',
                     db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
-                    db.Column('created_at', DateTime, nullable=False, default=datetime.now()),
+                    db.Column('created_at', DateTime, nullable=False, default=datetime.now),
+                    Index('response_created_at_index', 'created_at')
                     )
+
+# per-user, per-day rollups of 'point' and 'response'. the windows of rankings are summed from these.
+point_daily = db.Table('point_daily',
+                       db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
+                       db.Column('day', Date, nullable=False),
+                       db.Column('point', Integer, nullable=False, default=0),
+                       db.Column('right_count', Integer, nullable=False, default=0),
+                       db.Column('first_count', Integer, nullable=False, default=0),
+                       db.Column('wrong_count', Integer, nullable=False, default=0),
+                       db.Column('even_count', Integer, nullable=False, default=0),
+                       PrimaryKeyConstraint('user_id', 'day'),
+                       Index('point_daily_day_index', 'day')
+                       )
+
+response_daily = db.Table('response_daily',
+                          db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
+                          db.Column('day', Date, nullable=False),
+                          db.Column('response_count', Integer, nullable=False, default=0),
+                          PrimaryKeyConstraint('user_id', 'day'),
+                          Index('response_daily_day_index', 'day')
+                          )
+
+# how far the days have been expired from month/week accumulators of the rankings.
+# name: "{metric}_{period}" (ex: "point_week")
+ranking_window = db.Table('ranking_window',
+                          db.Column('name', String(20), primary_key=True),
+                          db.Column('expired_until', DateTime, nullable=False),
+                          )
+
+# participants (users with a value) of each ranking, counted when the rankings are refreshed by batch.py.
+# name: "{metric}_{period}" (ex: "point_total")
+ranking_summary = db.Table('ranking_summary',
+                           db.Column('name', String(20), primary_key=True),
+                           db.Column('participants', Integer, nullable=False, default=0),
+                           db.Column('updated_at', DateTime, nullable=False, default=datetime.now),
+                           )
+
+# prebuilt top-N pages of each ranking. "generation" counts up on every publish. (used as the ETag)
+# name: "{metric}_{period}" (ex: "response_month")
+ranking_snapshot = db.Table('ranking_snapshot',
+                            db.Column('name', String(20), primary_key=True),
+                            db.Column('generation', Integer, nullable=False, default=1),
+                            db.Column('payload', JSON, nullable=False),
+                            db.Column('published_at', DateTime, nullable=False, default=datetime.now),
+                            )
+
+
+def record_point(user_id: int, value: int) -> None:
+    """Insert the point and count it up in today's rollup."""
+    db.session.execute(point.insert().values(user_id=user_id, point=value))
+
+    category = POINT_CATEGORY_COLUMNS[AnswerResultPoint(value)]
+    statement = insert(point_daily).values({"user_id": user_id, "day": date.today(), "point": value, category: 1})
+    statement = statement.on_duplicate_key_update({
+        "point": point_daily.c.point + value,
+        category: point_daily.c[category] + 1
+    })
+    db.session.execute(statement)
+
+
+def record_response(user_id: int) -> None:
+    """Insert the response and count it up in today's rollup."""
+    db.session.execute(response.insert().values(user_id=user_id))
+
+    statement = insert(response_daily).values(user_id=user_id, day=date.today(), response_count=1)
+    statement = statement.on_duplicate_key_update(response_count=response_daily.c.response_count + 1)
+    db.session.execute(statement)
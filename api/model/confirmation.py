@@ -1,7 +1,7 @@
 from random import randrange
 from time import time
 from uuid import uuid4
-from sqlalchemy import String, Integer, Column, ForeignKey, Boolean, UniqueConstraint
+from sqlalchemy import String, Integer, Column, ForeignKey, Boolean, UniqueConstraint, Index
 
 from database import db
 
@@ -15,6 +15,9 @@ class Confirmation(db.Model):
     confirmed = Column(Boolean, nullable=False, default=False)
     user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"))
 
+    # for most_recent_confirmation.
+    __table_args__ = (Index('confirmation_user_id_expire_at_index', 'user_id', 'expire_at'),)
+
     def __init__(self, user_id: int, **kwargs):
         super().__init__(**kwargs)
         self.user_id = user_id
@@ -1,5 +1,7 @@
 from datetime import datetime
-from sqlalchemy import String, Integer, Column, DateTime, ForeignKey, UniqueConstraint, Boolean, Enum
+
+from flask_jwt_extended import current_user
+from sqlalchemy import String, Integer, Column, DateTime, ForeignKey, UniqueConstraint, Boolean, Enum, Index, Computed
 
 from api.model.enum.enums import NotificationCategory
 from database import db
@@ -10,22 +12,34 @@ user_relationship = db.Table('user_relationship',
                              db.Column('followed_id', Integer, ForeignKey('user.id', ondelete="CASCADE"),
                                        nullable=False),
                              db.Column('created_at', DateTime, nullable=False, default=datetime.now()),
-                             UniqueConstraint('following_id', 'followed_id', name='user_relationship_unique_key')
+                             UniqueConstraint('following_id', 'followed_id', name='user_relationship_unique_key'),
+                             Index('user_relationship_following_id_created_at_index',
+                                   'following_id', 'created_at', 'followed_id'),
+                             Index('user_relationship_followed_id_created_at_index',
+                                   'followed_id', 'created_at', 'following_id')
                              )
 
 
 class TokenBlocklist(db.Model):
     id = Column(Integer, primary_key=True)
-    jti = Column(String(36), nullable=False)
+    jti = Column(String(36), nullable=False, unique=True)
     created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, default=None, index=True)  # UTC. "exp" of the token.
 
 
 class Notification(db.Model):
+    __table_args__ = (
+        Index('notification_passive_id_watched_index', 'passive_id', 'watched', 'id'),
+        UniqueConstraint('active_id', 'passive_id', 'category', 'question_key', name='notification_unique_key'),
+        {}
+    )
     id = Column(Integer, primary_key=True)
     passive_id = Column(Integer, ForeignKey('user.id', ondelete="CASCADE"))
     active_id = Column(Integer, ForeignKey('user.id', ondelete="CASCADE"))
     category = Column(Enum(NotificationCategory), nullable=False)
     question_id = Column(Integer, default=None)
+    # NULL is not unique in the unique key, so "follow" is keyed by 0.
+    question_key = Column(Integer, Computed("coalesce(question_id, 0)", persisted=True))
     watched = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime, nullable=False, default=datetime.now)
 
@@ -43,6 +57,14 @@ class Notification(db.Model):
             "created_at": str(self.created_at)
         }
 
+    @classmethod
+    def to_dict_list(cls, objects: list) -> list[dict]:
+        """Serialize the (Notification, User) rows. follow state of the users is resolved by one query."""
+        current_user.load_membership("followings", list(map(lambda x: x.User.id, objects)))
+        return list(map(lambda x: x.Notification.to_dict() | {
+            "user": x.User.to_dict()
+        }, objects))
+
 
 class SearchHistory(db.Model):
     __table_args__ = (UniqueConstraint('user_id', 'target_id'), {})
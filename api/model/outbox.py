@@ -0,0 +1,186 @@
+"""Outbox Tables
+Side effects of the requests (notifications, counters, derived tables, emails) appended in the request's
+transaction, and drained in batches by the worker. (worker.py)
+Obsolete S3 objects are queued in object_deletion, and deleted in batches by the worker too.
+The worker claims the rows by an UPDATE of their claimed_by (MySQL 5.7 has no SKIP LOCKED), and a row
+claimed by a dead worker is claimed again after the lease. So a worker deletes or releases only the rows still
+claimed by itself (claimed_by = worker_id), and rolls back its side effects if the claim was taken over.
+An event failed OUTBOX_MAX_ATTEMPTS times is kept as dead (dead_at), not deleted, because its side effects
+(points, rollups, notifications) are written only by the worker. 'flask outbox_revive' retries them.
+"""
+
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import Integer, DateTime, String, Index, JSON, Text, or_
+
+from database import db
+
+OUTBOX_ANSWER_CREATED = "answer_created"
+OUTBOX_USER_FOLLOWED = "user_followed"
+OUTBOX_USER_UNFOLLOWED = "user_unfollowed"
+
+outbox_event = db.Table('outbox_event',
+                        db.Column('id', Integer, primary_key=True),
+                        db.Column('topic', String(30), nullable=False),
+                        db.Column('payload', JSON, nullable=False),
+                        db.Column('attempts', Integer, nullable=False, default=0),
+                        db.Column('claimed_by', String(36), default=None),
+                        db.Column('claimed_at', DateTime, default=None),
+                        db.Column('created_at', DateTime, nullable=False, default=datetime.now),
+                        db.Column('dead_at', DateTime, default=None),
+                        Index('outbox_event_claimed_at_index', 'dead_at', 'claimed_at', 'id'),
+                        Index('outbox_event_claimed_by_index', 'claimed_by')
+                        )
+
+# emails to send. "available_at" is put off on every failure. (backoff)
+email_outbox = db.Table('email_outbox',
+                        db.Column('id', Integer, primary_key=True),
+                        db.Column('recipients', JSON, nullable=False),
+                        db.Column('subject', String(255), nullable=False),
+                        db.Column('text', Text, nullable=False),
+                        db.Column('html', Text, nullable=False),
+                        db.Column('attempts', Integer, nullable=False, default=0),
+                        db.Column('available_at', DateTime, nullable=False, default=datetime.now),
+                        db.Column('claimed_by', String(36), default=None),
+                        db.Column('claimed_at', DateTime, default=None),
+                        db.Column('created_at', DateTime, nullable=False, default=datetime.now),
+                        Index('email_outbox_claimed_at_index', 'claimed_at', 'available_at'),
+                        Index('email_outbox_claimed_by_index', 'claimed_by')
+                        )
+
+# S3 keys to delete. "available_at" is put off on every failure. (backoff)
+object_deletion = db.Table('object_deletion',
+                           db.Column('id', Integer, primary_key=True),
+                           db.Column('key', String(1024), nullable=False),
+                           db.Column('attempts', Integer, nullable=False, default=0),
+                           db.Column('available_at', DateTime, nullable=False, default=datetime.now),
+                           db.Column('claimed_by', String(36), default=None),
+                           db.Column('claimed_at', DateTime, default=None),
+                           db.Column('created_at', DateTime, nullable=False, default=datetime.now),
+                           Index('object_deletion_claimed_at_index', 'claimed_at', 'available_at'),
+                           Index('object_deletion_claimed_by_index', 'claimed_by')
+                           )
+
+
+def append_event(topic: str, **payload) -> None:
+    """Append the event in the current transaction. (it's visible to the worker only after the commit)"""
+    db.session.execute(outbox_event.insert().values(topic=topic, payload=payload, created_at=datetime.now()))
+
+
+def enqueue_email(recipients: list[str], subject: str, text: str, html: str) -> None:
+    """Append the email in the current transaction. (sent by the worker after the commit)"""
+    db.session.execute(email_outbox.insert().values(recipients=recipients, subject=subject, text=text, html=html,
+                                                    available_at=datetime.now(), created_at=datetime.now()))
+
+
+def enqueue_object_deletions(keys: list[str]) -> None:
+    """Append the S3 keys to delete in the current transaction. (deleted by the worker after the commit)"""
+    if keys:
+        db.session.execute(object_deletion.insert(),
+                           list(map(lambda x: {"key": x, "available_at": datetime.now(),
+                                               "created_at": datetime.now()}, keys)))
+
+
+def claim_events(batch_size: int, lease_seconds: int) -> tuple[str, list]:
+    return claim_rows(outbox_event, batch_size, lease_seconds, outbox_event.c.dead_at.is_(None))
+
+
+def claim_emails(batch_size: int, lease_seconds: int) -> tuple[str, list]:
+    return claim_rows(email_outbox, batch_size, lease_seconds, email_outbox.c.available_at <= datetime.now())
+
+
+def claim_object_deletions(batch_size: int, lease_seconds: int) -> tuple[str, list]:
+    return claim_rows(object_deletion, batch_size, lease_seconds, object_deletion.c.available_at <= datetime.now())
+
+
+def claim_rows(table, batch_size: int, lease_seconds: int, *conditions) -> tuple[str, list]:
+    """Claim the oldest rows not claimed (or whose lease expired), and commit the claim.
+    :return: (worker_id, claimed rows)
+    """
+    worker_id = str(uuid4())
+    expired_at = datetime.now() - timedelta(seconds=lease_seconds)
+    claimable = or_(table.c.claimed_at.is_(None), table.c.claimed_at < expired_at)
+    row_ids = list(map(lambda x: x.id, db.session.query(table.c.id)
+                       .filter(claimable, *conditions)
+                       .order_by(table.c.id)
+                       .limit(batch_size)
+                       .all()))
+    if not row_ids:
+        db.session.commit()
+        return worker_id, []
+
+    # the condition is checked again by the UPDATE, so a row taken by another worker in between is skipped.
+    db.session.execute(table.update()
+                       .where(table.c.id.in_(row_ids))
+                       .where(claimable)
+                       .values(claimed_by=worker_id, claimed_at=datetime.now(), attempts=table.c.attempts + 1))
+    db.session.commit()
+    return worker_id, db.session.query(table) \
+        .filter(table.c.claimed_by == worker_id) \
+        .order_by(table.c.id) \
+        .all()
+
+
+def delete_event(event_id: int, worker_id: str) -> bool:
+    """Delete the event if it's still claimed by the worker. (the row is locked until the commit)"""
+    return db.session.execute(outbox_event.delete()
+                              .where(outbox_event.c.id == event_id)
+                              .where(outbox_event.c.claimed_by == worker_id)).rowcount > 0
+
+
+def bury_event(event_id: int, worker_id: str) -> None:
+    """Keep the event as dead. (not claimed until revived)"""
+    db.session.execute(outbox_event.update()
+                       .where(outbox_event.c.id == event_id)
+                       .where(outbox_event.c.claimed_by == worker_id)
+                       .values(dead_at=datetime.now(), claimed_by=None, claimed_at=None))
+
+
+def revive_events() -> int:
+    """Make all the dead events claimable again, with the attempts reset."""
+    return db.session.execute(outbox_event.update()
+                              .where(outbox_event.c.dead_at.is_not(None))
+                              .values(dead_at=None, attempts=0)).rowcount
+
+
+def renew_email_claim(email_id: int, worker_id: str) -> bool:
+    """Restart the lease of the email if it's still claimed by the worker. (committed, so others see it)"""
+    renewed: bool = db.session.execute(email_outbox.update()
+                                       .where(email_outbox.c.id == email_id)
+                                       .where(email_outbox.c.claimed_by == worker_id)
+                                       .values(claimed_at=datetime.now())).rowcount > 0
+    db.session.commit()
+    return renewed
+
+
+def delete_emails(email_ids: list[int], worker_id: str) -> None:
+    delete_rows(email_outbox, email_ids, worker_id)
+
+
+def put_off_emails(email_ids: list[int], worker_id: str, delay_seconds: int) -> None:
+    put_off_rows(email_outbox, email_ids, worker_id, delay_seconds)
+
+
+def delete_object_deletions(deletion_ids: list[int], worker_id: str) -> None:
+    delete_rows(object_deletion, deletion_ids, worker_id)
+
+
+def put_off_object_deletions(deletion_ids: list[int], worker_id: str, delay_seconds: int) -> None:
+    put_off_rows(object_deletion, deletion_ids, worker_id, delay_seconds)
+
+
+def delete_rows(table, row_ids: list[int], worker_id: str) -> None:
+    """Delete the rows still claimed by the worker."""
+    db.session.execute(table.delete()
+                       .where(table.c.id.in_(row_ids))
+                       .where(table.c.claimed_by == worker_id))
+
+
+def put_off_rows(table, row_ids: list[int], worker_id: str, delay_seconds: int) -> None:
+    """Release the rows still claimed by the worker, to be claimed again after the delay."""
+    db.session.execute(table.update()
+                       .where(table.c.id.in_(row_ids))
+                       .where(table.c.claimed_by == worker_id)
+                       .values(claimed_by=None, claimed_at=None,
+                               available_at=datetime.now() + timedelta(seconds=delay_seconds)))
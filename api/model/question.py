@@ -1,24 +1,34 @@
 from datetime import datetime
+from random import randint, choice
 
 from flask_jwt_extended import current_user
-from sqlalchemy import String, Integer, Column, DateTime, ForeignKey, UniqueConstraint, Enum
+from sqlalchemy import String, Integer, Column, DateTime, ForeignKey, UniqueConstraint, Enum, Index, exists, func
+from sqlalchemy.dialects.mysql import insert
 
 from api.model.enum.enums import QuestionOption
 from database import db
 
+# the answers of a question are spread over this number of tally rows (by user_id).
+QUESTION_TALLY_SHARDS = 8
+# random probes of find_random_answerable, each scanning an id window of this width.
+QUESTION_RANDOM_PROBES = 8
+QUESTION_RANDOM_WINDOW = 64
+
 answer = db.Table('answer',
                   db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
                   db.Column('question_id', Integer, ForeignKey('question.id', ondelete="CASCADE"), nullable=False),
                   db.Column('option', Enum(QuestionOption), nullable=False),
                   db.Column('created_at', DateTime, nullable=False, default=datetime.now()),
-                  UniqueConstraint('user_id', 'question_id', name='answer_unique_key')
+                  UniqueConstraint('user_id', 'question_id', name='answer_unique_key'),
+                  Index('answer_user_id_created_at_index', 'user_id', 'created_at', 'question_id')
                   )
 
 bookmark = db.Table('bookmark',
                     db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
                     db.Column('question_id', Integer, ForeignKey('question.id', ondelete="CASCADE"), nullable=False),
                     db.Column('created_at', DateTime, nullable=False, default=datetime.now()),
-                    UniqueConstraint('user_id', 'question_id', name='bookmark_unique_key')
+                    UniqueConstraint('user_id', 'question_id', name='bookmark_unique_key'),
+                    Index('bookmark_user_id_created_at_index', 'user_id', 'created_at', 'question_id')
                     )
 
 
@@ -47,7 +57,7 @@ class Question(db.Model):
         lazy="dynamic"
     )
 
-    def to_dict(self):
+    def to_dict(self, answered_count: int = None):
         return {
             "id": self.id,
             "user_id": self.user_id,
@@ -56,14 +66,65 @@ class Question(db.Model):
             "option_second": self.option_second,
             "created_at": str(self.created_at),
             "is_answered": self.is_answered,
-            "answered_count": len(self.answered_users.all()),
+            "answered_count": self.answered_count if answered_count is None else answered_count,
             "is_bookmarked": self.is_bookmarked
         }
 
+    @classmethod
+    def to_dict_list(cls, objects: list) -> list[dict]:
+        """Serialize the page of (Question, User) rows at once.
+        The viewer context is resolved by one grouped query each (only for ids on the page), not per row.
+        """
+        question_ids: list[int] = list(map(lambda x: x.Question.id, objects))
+        if not question_ids:
+            return []
+
+        current_user.load_membership("answered_questions", question_ids)
+        current_user.load_membership("bookmarks", question_ids)
+        current_user.load_membership("followings", list(map(lambda x: x.User.id, objects)))
+
+        answered_counts: dict = QuestionTally.find_total_counts(question_ids)
+
+        return list(map(lambda x: x.Question.to_dict(answered_count=answered_counts.get(x.Question.id, 0)) | {
+            "user": x.User.to_dict()
+        }, objects))
+
     @classmethod
     def find_by_id(cls, _id: int) -> "Question":
         return cls.query.filter_by(id=_id).first()
 
+    @classmethod
+    def find_random_answerable(cls, user_id: int) -> "Question" or None:
+        """Pick at random a question the user neither owns nor answered.
+        Each probe scans a window of QUESTION_RANDOM_WINDOW ids from a random id (anti-join to 'answer'), and picks
+        one of the answerable questions in it at random. The windows are independent, so the question after a long
+        run of answered ids is not favored. Only when every probe misses, take the first answerable question from
+        a random id, wrapping around. No ORDER BY RAND() and no NOT IN list of answered ids.
+        """
+        min_id, max_id = db.session.query(func.min(cls.id), func.max(cls.id)).one()
+        if min_id is None:
+            return None
+
+        answerable_query = cls.query \
+            .filter(cls.user_id != user_id) \
+            .filter(~exists().where(answer.c.question_id == cls.id).where(answer.c.user_id == user_id))
+
+        for _ in range(QUESTION_RANDOM_PROBES):
+            start = randint(min_id, max_id)
+            questions = answerable_query \
+                .filter(cls.id >= start) \
+                .filter(cls.id < start + QUESTION_RANDOM_WINDOW) \
+                .all()
+            if questions:
+                return choice(questions)
+
+        # almost all the questions are answered. (scans up to the whole table)
+        pivot = randint(min_id, max_id)
+        question = answerable_query.filter(cls.id >= pivot).order_by(cls.id.asc()).first()
+        if not question:
+            question = answerable_query.filter(cls.id < pivot).order_by(cls.id.desc()).first()
+        return question
+
     def save_to_db(self) -> None:
         db.session.add(self)
         db.session.commit()
@@ -72,19 +133,63 @@ class Question(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @property
+    def answered_count(self) -> int:
+        return QuestionTally.find_counts(self.id)["total"]
+
     # whether current_user bookmarked the question.
     @property
     def is_bookmarked(self) -> bool:
-        if current_user.is_bookmark_question(self):
-            return True
-        else:
-            return False
+        return current_user.is_bookmark_question(self)
 
     # whether current_user answered the question.
     @property
     def is_answered(self) -> bool:
-        if current_user.is_answered_question(self):
-            return True
-        else:
-            return False
+        return current_user.is_answered_question(self)
+
+
+class QuestionTally(db.Model):
+    """QuestionTally
+    Denormalized answer counts of the question, updated in the same transaction as the 'answer' insert.
+    A question has up to QUESTION_TALLY_SHARDS rows, so concurrent answers don't serialize on one row.
+    """
+    question_id = Column(Integer, ForeignKey('question.id', ondelete="CASCADE"), primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    total_count = Column(Integer, nullable=False, default=0)
+    first_count = Column(Integer, nullable=False, default=0)
+    second_count = Column(Integer, nullable=False, default=0)
 
+    @classmethod
+    def increment(cls, question_id: int, user_id: int, option: str) -> None:
+        is_first = 1 if option == QuestionOption.first.value else 0
+        statement = insert(cls.__table__).values(
+            question_id=question_id,
+            shard=user_id % QUESTION_TALLY_SHARDS,
+            total_count=1,
+            first_count=is_first,
+            second_count=1 - is_first
+        )
+        statement = statement.on_duplicate_key_update(
+            total_count=cls.total_count + 1,
+            first_count=cls.first_count + statement.inserted.first_count,
+            second_count=cls.second_count + statement.inserted.second_count
+        )
+        db.session.execute(statement)
+
+    @classmethod
+    def find_counts(cls, question_id: int) -> dict:
+        result = db.session.query(func.sum(cls.total_count).label("total"),
+                                  func.sum(cls.first_count).label("first"),
+                                  func.sum(cls.second_count).label("second")) \
+            .filter(cls.question_id == question_id) \
+            .one()
+        return {"total": int(result.total or 0), "first": int(result.first or 0), "second": int(result.second or 0)}
+
+    @classmethod
+    def find_total_counts(cls, question_ids: list[int]) -> dict:
+        """{question_id: total answers} of the questions by one grouped query."""
+        objects = db.session.query(cls.question_id, func.sum(cls.total_count).label("total")) \
+            .filter(cls.question_id.in_(question_ids)) \
+            .group_by(cls.question_id) \
+            .all()
+        return dict(map(lambda x: (x.question_id, int(x.total)), objects))
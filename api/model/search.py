@@ -0,0 +1,67 @@
+"""Search Tables
+N-gram index of the users for UsersSearch.
+The searchable text (username + nickname_replaced, lower-cased) is split into the grams of 1 and 2 characters,
+and each gram has a posting list of the user ids. A search term is looked up by joining the posting lists of its
+grams, so the cost depends on the rarest gram, not on the number of users.
+The candidates are ranked by the follower count in UserCounters. (no GROUP BY over user_relationship)
+"""
+
+from sqlalchemy import Integer, ForeignKey, String, Index, PrimaryKeyConstraint
+from sqlalchemy.orm import aliased
+
+from database import db
+
+SEARCH_TERM_MAX_LENGTH = 35  # username (15) + nickname (20)
+
+user_search_gram = db.Table('user_search_gram',
+                            db.Column('gram', String(2, collation="utf8mb4_bin"), nullable=False),
+                            db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"),
+                                      nullable=False),
+                            PrimaryKeyConstraint('gram', 'user_id'),
+                            Index('user_search_gram_user_id_index', 'user_id')
+                            )
+
+
+def search_text(username: str, nickname_replaced: str) -> str:
+    return (username + nickname_replaced).lower()
+
+
+def text_grams(text: str) -> set[str]:
+    """All the grams of 1 and 2 characters in the text."""
+    return set(text) | set(map(lambda x: text[x:x + 2], range(len(text) - 1)))
+
+
+def term_grams(term: str) -> set[str]:
+    """Grams to look up for the term. (bigrams are enough to cover a term longer than 1 character)"""
+    if len(term) == 1:
+        return {term}
+    return set(map(lambda x: term[x:x + 2], range(len(term) - 1)))
+
+
+def index_user(user) -> None:
+    """Replace the postings of the user. (call on signup and when username/nickname change)"""
+    db.session.execute(user_search_gram.delete().where(user_search_gram.c.user_id == user.id))
+    grams = text_grams(search_text(user.username, user.nickname_replaced))
+    if grams:
+        db.session.execute(user_search_gram.insert(),
+                           list(map(lambda x: {"gram": x, "user_id": user.id}, grams)))
+
+
+def search_user_query(term: str):
+    """Query of (User, follower_count) matching the term. (not ordered)"""
+    from api.model.user import User, UserCounters
+
+    term = term.lower()[:SEARCH_TERM_MAX_LENGTH]
+    query = db.session.query(User, UserCounters.followers.label("follower_count"))
+    previous = None
+    for gram in sorted(term_grams(term)):
+        posting = aliased(user_search_gram)
+        query = query.select_from(posting) if previous is None \
+            else query.join(posting, posting.c.user_id == previous.c.user_id)
+        query = query.filter(posting.c.gram == gram)
+        previous = posting
+
+    # the grams don't keep the order, so check the substring itself on the candidates.
+    return query.join(UserCounters, UserCounters.user_id == previous.c.user_id) \
+        .join(User, User.id == UserCounters.user_id) \
+        .filter((User.username + User.nickname_replaced).contains(term, autoescape=True))
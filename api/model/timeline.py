@@ -0,0 +1,109 @@
+"""Timeline Tables
+Materialized home timeline of each user (fan-out on write).
+A new question is pushed into the inbox of the author and every follower, so reading the timeline is
+a range scan of the inbox. Authors with too many followers are "pull" authors; their questions are not pushed
+but merged on read.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Integer, ForeignKey, DateTime, UniqueConstraint, Index, literal, select
+from sqlalchemy.dialects.mysql import insert
+
+from api.model.others import user_relationship
+from api.model.question import Question
+from database import db
+
+TIMELINE_FANOUT_LIMIT = 10000  # followers. over this, the author becomes a "pull" author.
+TIMELINE_BACKFILL_SIZE = 100  # latest questions pushed to the inbox when following.
+
+timeline = db.Table('timeline',
+                    db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
+                    db.Column('question_id', Integer, ForeignKey('question.id', ondelete="CASCADE"),
+                              nullable=False),
+                    db.Column('author_id', Integer, ForeignKey('user.id', ondelete="CASCADE"), nullable=False),
+                    UniqueConstraint('user_id', 'question_id', name='timeline_unique_key'),
+                    Index('timeline_user_id_author_id_index', 'user_id', 'author_id')
+                    )
+
+timeline_pull_author = db.Table('timeline_pull_author',
+                                db.Column('user_id', Integer, ForeignKey('user.id', ondelete="CASCADE"),
+                                          primary_key=True),
+                                db.Column('created_at', DateTime, nullable=False, default=datetime.now),
+                                )
+
+
+def is_pull_author(user_id: int) -> bool:
+    return db.session.query(timeline_pull_author.c.user_id) \
+               .filter(timeline_pull_author.c.user_id == user_id) \
+               .scalar() is not None
+
+
+def fan_out_question(question: Question) -> None:
+    """Push the new question into the inbox of the author and followers."""
+    recipients = select(literal(question.user_id).label("user_id"))
+    if not is_pull_author(question.user_id):
+        recipients = recipients.union_all(
+            select(user_relationship.c.following_id.label("user_id"))
+            .where(user_relationship.c.followed_id == question.user_id))
+    recipients = recipients.subquery()
+
+    db.session.execute(timeline.insert().from_select(
+        ['user_id', 'question_id', 'author_id'],
+        select(recipients.c.user_id, literal(question.id), literal(question.user_id))
+    ))
+
+
+def backfill_timeline(user_id: int, author_id: int) -> None:
+    """When following, push the latest questions of the author. (or mark the author as "pull")"""
+    from api.model.user import UserCounters
+
+    follower_count: int = db.session.query(UserCounters.followers) \
+        .filter(UserCounters.user_id == author_id) \
+        .scalar() or 0
+    if follower_count > TIMELINE_FANOUT_LIMIT:
+        db.session.execute(insert(timeline_pull_author).prefix_with("IGNORE").values(
+            user_id=author_id,
+            created_at=datetime.now()
+        ))
+
+    if is_pull_author(author_id):
+        return
+
+    latest_questions = select(literal(user_id), Question.id, Question.user_id) \
+        .where(Question.user_id == author_id) \
+        .order_by(Question.id.desc()) \
+        .limit(TIMELINE_BACKFILL_SIZE)
+    db.session.execute(insert(timeline).prefix_with("IGNORE").from_select(
+        ['user_id', 'question_id', 'author_id'], latest_questions))
+
+
+def trim_timeline(user_id: int, author_id: int) -> None:
+    """When unfollowing, remove the questions of the author from the inbox."""
+    db.session.execute(timeline.delete()
+                       .where(timeline.c.user_id == user_id)
+                       .where(timeline.c.author_id == author_id))
+
+
+def timeline_query(user_id: int):
+    """Query of (Question, User) in the timeline of the user. (not ordered)"""
+    from api.model.user import User
+
+    base_query = db.session.query(Question, User) \
+        .join(timeline, timeline.c.question_id == Question.id) \
+        .filter(timeline.c.user_id == user_id) \
+        .join(User, User.id == Question.user_id)
+
+    # merge on read the questions of "pull" authors the user follows.
+    pull_author_ids: list[int] = list(map(lambda x: x.user_id, db.session.query(timeline_pull_author.c.user_id)
+                                          .join(user_relationship,
+                                                user_relationship.c.followed_id == timeline_pull_author.c.user_id)
+                                          .filter(user_relationship.c.following_id == user_id)
+                                          .all()))
+    if not pull_author_ids:
+        return base_query
+
+    pull_query = db.session.query(Question, User) \
+        .filter(Question.user_id.in_(pull_author_ids)) \
+        .join(User, User.id == Question.user_id)
+    return base_query.union(pull_query)
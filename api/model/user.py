@@ -2,22 +2,44 @@ import os
 from datetime import datetime
 from random import randrange
 from time import time
+from types import SimpleNamespace
 
-from flask import Response, render_template
+from flask import render_template, g
 from flask_jwt_extended import current_user
-from sqlalchemy import String, Integer, Column, DateTime, Enum, ForeignKey, Boolean
+from sqlalchemy import String, Integer, Column, DateTime, Enum, ForeignKey, Boolean, Index, func, or_, and_
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import aliased
 from werkzeug.security import generate_password_hash
 
-from api.libs.mailgun import MailGun
 from api.model.confirmation import Confirmation, UpdateEmail
 
-from api.model.enum.enums import UserRole, NotificationCategory
+from api.model.aggregate import POINT_CATEGORY_COLUMNS, ranking_summary, ranking_snapshot
+from api.model.enum.enums import UserRole, NotificationCategory, AnswerResultPoint
 from api.model.others import Notification, user_relationship
+from api.model.outbox import append_event, enqueue_email, OUTBOX_USER_FOLLOWED, OUTBOX_USER_UNFOLLOWED
 from api.model.question import answer, bookmark
 from database import db
 
 CONFIRMATION_EXPIRE_DELTA = 1800  # 30minutes
 
+# periods of the rankings and their windows. ("total" has no window)
+RANKING_PERIODS = ["total", "month", "week"]
+RANKING_WINDOWS = {"month": {"days": 30}, "week": {"days": 7}}
+RANKING_SIZE = 30
+
+# (owner column, target column) of the follow lists. "followings" of the user and "followers" of the user.
+RELATIONSHIP_COLUMNS = {
+    "followings": (user_relationship.c.following_id, user_relationship.c.followed_id),
+    "followers": (user_relationship.c.followed_id, user_relationship.c.following_id),
+}
+
+# (owner column, target column) of each relationship held in the membership index.
+MEMBERSHIP_COLUMNS = {
+    "followings": (user_relationship.c.following_id, user_relationship.c.followed_id),
+    "answered_questions": (answer.c.user_id, answer.c.question_id),
+    "bookmarks": (bookmark.c.user_id, bookmark.c.question_id),
+}
+
 
 class User(db.Model):
     """UserModel
@@ -45,6 +67,9 @@ class User(db.Model):
     # is_deleted
     is_deleted = Column(Boolean, nullable=False, default=False)
 
+    # set when the registration is confirmed. (the login doesn't query the confirmations)
+    confirmed_at = Column(DateTime, default=None)
+
     def __init__(self, username: str, email: str, password: str, **kwargs):
         super().__init__(**kwargs)
         self.username = username
@@ -54,8 +79,13 @@ class User(db.Model):
         self.nickname_replaced = username.replace(' ', '').replace('　', '')
         # * Default avatar (ex: "egg_1.png")
         self.avatar = f"egg_{randrange(1, 11)}.png"
+        self.counters = UserCounters()
 
     def to_dict(self) -> dict:
+        return self.to_profile_dict() | {"is_following": current_user.is_following(self)}
+
+    def to_profile_dict(self) -> dict:
+        """to_dict without the viewer specific fields."""
         return {
             "id": self.id,
             "username": self.username,
@@ -65,10 +95,37 @@ class User(db.Model):
             "avatar": self.avatar,
             "created_at": str(self.created_at),
             "updated_at": str(self.updated_at),
-            "is_following": True if current_user.is_following(self) else False,
             "role": self.role
         }
 
+    @classmethod
+    def to_dict_list(cls, users: list) -> list[dict]:
+        """Serialize the users, resolving current_user's follow state for all of them by one query."""
+        current_user.load_membership("followings", list(map(lambda x: x.id, users)))
+        return list(map(lambda x: x.to_dict(), users))
+
+    @classmethod
+    def relationship_query(cls, user_id: int, name: str):
+        """Query of (User, followed_at, viewer_following_id) in the follow list of the user. (not ordered)
+        current_user's follow state is outer joined, so the page needs no other query for it.
+        """
+        owner_column, target_column = RELATIONSHIP_COLUMNS[name]
+        viewer = aliased(user_relationship)
+        return db.session.query(cls, user_relationship.c.created_at.label("followed_at"),
+                                viewer.c.following_id.label("viewer_following_id")) \
+            .select_from(user_relationship) \
+            .filter(owner_column == user_id) \
+            .join(cls, cls.id == target_column) \
+            .outerjoin(viewer, and_(viewer.c.following_id == current_user.id, viewer.c.followed_id == cls.id))
+
+    @classmethod
+    def relationship_to_dict_list(cls, objects: list) -> list[dict]:
+        """Serialize the rows of relationship_query."""
+        current_user.merge_membership("followings", dict(map(
+            lambda x: (x.User.id, x.viewer_following_id is not None), objects)))
+        return list(map(lambda x: x.User.to_dict(), objects))
+
+    counters = db.relationship('UserCounters', lazy=True, cascade='all, delete-orphan', uselist=False)
     point_stats = db.relationship('PointStats', backref="user", lazy=True, cascade='all, delete-orphan',
                                   uselist=False)
     response_stats = db.relationship('ResponseStats', backref="user", lazy=True, cascade='all, delete-orphan',
@@ -150,12 +207,22 @@ class User(db.Model):
 
     """Confirmation"""
 
+    @classmethod
+    def find_for_login(cls, username_or_email: str) -> "User":
+        """One indexed lookup by the username or email. (confirmed_at tells the confirmation status)"""
+        column = cls.email if "@" in username_or_email else cls.username
+        return cls.query.filter(column == username_or_email).one_or_none()
+
+    def confirm(self, confirmation: Confirmation) -> None:
+        confirmation.confirmed = True
+        self.confirmed_at = datetime.now()
+
     @property
     def most_recent_confirmation(self) -> Confirmation:
         # Because of setting dynamic to "confirmations", it can be to take sequence of querying.
         return self.confirmations.order_by(Confirmation.expire_at.desc()).first()
 
-    def send_confirmation_email(self) -> Response:
+    def send_confirmation_email(self) -> None:
         # ex: https://127.0.0.1:5000/ > https://127.0.0.1:5000
         # link = request.url_root[0:-1] + f"/api/v1/auth/{self.most_recent_confirmation.id}/confirm"
         link = os.getenv("FRONT_URL") + f"/welcome?=confirm={self.most_recent_confirmation.id}"
@@ -165,7 +232,7 @@ class User(db.Model):
         html = render_template("confirmation.html", name=self.nickname, link=link, salutation="Welcome to Enqueter.",
                                content="Please click the below button to confirm your account.",
                                btn="Confirm the account", btn_color="#504e4b", font_size="16px", update_email=False)
-        return MailGun.send_email([self.email], subject, text, html)
+        enqueue_email([self.email], subject, text, html)
 
     """Reset password"""
 
@@ -182,14 +249,14 @@ class User(db.Model):
         self.reset_expired_at = int(time()) + CONFIRMATION_EXPIRE_DELTA
         db.session.commit()
 
-    def send_reset_password_email(self, token) -> Response:
+    def send_reset_password_email(self, token) -> None:
         link = os.getenv("FRONT_URL") + f"/welcome?token={token}&email={self.email}"
         subject = "Reset password"
         text = f"Hi,{self.nickname}. Please click the link to reset your password. {link}"
         html = render_template("confirmation.html", name=self.nickname, link=link, salutation="Forgot password?",
                                content="If so, please click the below button to reset your password.",
                                btn="Reset password", btn_color="#c29a5d", font_size="16px", update_email=False)
-        return MailGun.send_email([self.email], subject, text, html)
+        enqueue_email([self.email], subject, text, html)
 
     """Update Email"""
 
@@ -197,7 +264,7 @@ class User(db.Model):
     def most_recent_update_email_confirmation(self) -> UpdateEmail:
         return self.update_emails.order_by(UpdateEmail.expire_at.desc()).first()
 
-    def send_update_confirmation_email(self) -> Response:
+    def send_update_confirmation_email(self) -> None:
         update_email = self.most_recent_update_email_confirmation
         subject = "Update E-mail"
         code = update_email.code
@@ -205,92 +272,301 @@ class User(db.Model):
         html = render_template("confirmation.html", name=self.nickname, salutation="Change your E-mail?",
                                content="If so, please enter the below numbers to Enqueter.",
                                btn=code, btn_color="#e0dcd8", font_size="20px", update_email=True)
-        return MailGun.send_email([update_email.email], subject, text, html)
+        enqueue_email([update_email.email], subject, text, html)
+
+    """Membership index
+    Integer id sets of the user's relationships, loaded at most once per request (kept in flask.g).
+    "scope" is the set of target ids already looked up, or None when the whole relationship is loaded.
+    """
+
+    def _membership_index(self, name: str) -> dict:
+        index = g.setdefault("membership_index", {})
+        return index.setdefault((self.id, name), {"ids": set(), "scope": set()})
+
+    def load_membership(self, name: str, target_ids: list[int] = None) -> None:
+        """Load the ids of the relationship. if target_ids are given, only those are looked up."""
+        entry = self._membership_index(name)
+        if entry["scope"] is None:
+            return
+
+        owner_column, target_column = MEMBERSHIP_COLUMNS[name]
+        query = db.session.query(target_column).filter(owner_column == self.id)
+        if target_ids is not None:
+            target_ids = set(target_ids) - entry["scope"]
+            if not target_ids:
+                return
+            query = query.filter(target_column.in_(target_ids))
+
+        entry["ids"] |= set(map(lambda x: x[0], query.all()))
+        entry["scope"] = None if target_ids is None else entry["scope"] | target_ids
+
+    def has_membership(self, name: str, target_id: int) -> bool:
+        entry = self._membership_index(name)
+        if entry["scope"] is not None and target_id not in entry["scope"]:
+            self.load_membership(name)
+        return target_id in entry["ids"]
+
+    def merge_membership(self, name: str, states: dict[int, bool]) -> None:
+        """Put the already known states ({target_id: is_member}) into the index."""
+        for target_id, is_member in states.items():
+            self._set_membership(name, target_id, is_member)
+
+    def _set_membership(self, name: str, target_id: int, is_member: bool) -> None:
+        entry = self._membership_index(name)
+        if is_member:
+            entry["ids"].add(target_id)
+        else:
+            entry["ids"].discard(target_id)
+        if entry["scope"] is not None:
+            entry["scope"].add(target_id)
 
     """Relationships"""
 
     def follow(self, user) -> None:
         if not self.is_following(user) and not self.id == user.id:
-            self.followings.append(user)
+            db.session.execute(user_relationship.insert().values(
+                following_id=self.id,
+                followed_id=user.id,
+                created_at=datetime.now()
+            ))
+            db.session.expire(self, ["followings"])
+            db.session.expire(user, ["follower"])
+            self._set_membership("followings", user.id, True)
+            # counters, timeline and notification are done by the worker.
+            append_event(OUTBOX_USER_FOLLOWED, user_id=self.id, followed_id=user.id)
 
     def unfollow(self, user) -> None:
         if self.is_following(user):
-            self.followings.remove(user)
+            db.session.execute(user_relationship.delete()
+                               .where(user_relationship.c.following_id == self.id)
+                               .where(user_relationship.c.followed_id == user.id))
+            db.session.expire(self, ["followings"])
+            db.session.expire(user, ["follower"])
+            self._set_membership("followings", user.id, False)
+            append_event(OUTBOX_USER_UNFOLLOWED, user_id=self.id, followed_id=user.id)
 
-    def is_following(self, user) -> list:
-        return list(filter(lambda x: x.id == user.id, self.followings))
+    def is_following(self, user) -> bool:
+        return self.has_membership("followings", user.id)
 
     """Answer"""
 
-    def is_answered_question(self, question) -> list:
-        return list(filter(lambda x: x.id == question.id, self.answered_questions))
+    def is_answered_question(self, question) -> bool:
+        return self.has_membership("answered_questions", question.id)
 
     """Bookmark"""
 
     def bookmark_question(self, question) -> None:
         if not self.is_bookmark_question(question):
             self.bookmarks.append(question)
+            self._set_membership("bookmarks", question.id, True)
 
     def un_bookmark_question(self, question) -> None:
         if self.is_bookmark_question(question):
             self.bookmarks.remove(question)
+            self._set_membership("bookmarks", question.id, False)
 
-    def is_bookmark_question(self, question) -> list:
-        return list(filter(lambda x: x.id == question.id, self.bookmarks))
+    def is_bookmark_question(self, question) -> bool:
+        return self.has_membership("bookmarks", question.id)
 
     """Notification"""
 
     def create_follow_notification(self, user) -> None:
-        if not self.is_same_notification(user.id, NotificationCategory.follow) and not self.id == user.id:
-            db.session.add(Notification(
-                passive_id=user.id,
-                active_id=self.id,
-                category=NotificationCategory.follow,
-            ))
+        if not self.id == user.id:
+            self.create_notification(user.id, NotificationCategory.follow)
 
     def create_answer_notification(self, question) -> None:
-        if not self.is_same_notification(question.user_id, NotificationCategory.answer, question_id=question.id) \
-                and not self.id == question.user_id:
-            db.session.add(Notification(
-                passive_id=question.user_id,
-                active_id=self.id,
-                category=NotificationCategory.answer,
-                question_id=question.id
-            ))
+        if not self.id == question.user_id:
+            self.create_notification(question.user_id, NotificationCategory.answer, question_id=question.id)
+
+    def create_notification(self, user_id: int, category: NotificationCategory, question_id: int = None) -> None:
+        """Insert the notification unless the same one exists. (deduplicated by the unique key)"""
+        result = db.session.execute(insert(Notification.__table__).prefix_with("IGNORE").values(
+            passive_id=user_id,
+            active_id=self.id,
+            category=category,
+            question_id=question_id,
+            watched=False,
+            created_at=datetime.now()
+        ))
+        if result.rowcount:
+            UserCounters.add(user_id, unread_notifications=1)
+
+    @property
+    def counters_dict(self) -> dict:
+        """Counts of the user. (zero if the counters row is missing, until 'flask counters_reconcile')"""
+        counters = self.counters or UserCounters(followers=0, followings=0, questions=0, answers=0)
+        return counters.to_dict()
+
+    @property
+    def unread_notifications_count(self) -> int:
+        return db.session.query(UserCounters.unread_notifications) \
+                   .filter(UserCounters.user_id == self.id) \
+                   .scalar() or 0
+
+    def watch_notifications(self, up_to_id: int = None) -> int:
+        """Mark the unread notifications (all, or up to the id) as watched by one UPDATE."""
+        query = Notification.query \
+            .filter(Notification.passive_id == self.id) \
+            .filter(Notification.watched.is_(False))
+        if up_to_id is not None:
+            query = query.filter(Notification.id <= up_to_id)
+        watched_count: int = query.update({Notification.watched: True}, synchronize_session=False)
+        if watched_count:
+            UserCounters.add(self.id, unread_notifications=-watched_count)
+        return watched_count
+
+    def delete_notifications(self) -> None:
+        Notification.query.filter_by(passive_id=self.id).delete(synchronize_session=False)
+        db.session.execute(UserCounters.__table__.update()
+                           .where(UserCounters.__table__.c.user_id == self.id)
+                           .values(unread_notifications=0))
+
+
+class RankingStats(object):
+    """Running total/month/week accumulators of a ranking metric. (base of PointStats and ResponseStats)
+    Deltas are applied on every answer, and month/week are expired by the sliding-window job in batch.py
+    with the daily rollups that left the window.
+    The rank is not stored but counted from the accumulators. (order by value desc, user_id desc)
+    """
+    metric: str = None
+
+    @classmethod
+    def get_column(cls, period: str) -> Column:
+        return cls.__table__.c[f"{period}_{cls.metric}"]
+
+    @classmethod
+    def apply(cls, user_id: int, delta: int, **increments) -> None:
+        """Add the delta to all the accumulators. (and increments to the other counter columns)"""
+        values: dict = dict(map(lambda x: (cls.get_column(x).name, delta), RANKING_PERIODS)) | increments
+        statement = insert(cls.__table__).values({"user_id": user_id} | values)
+        statement = statement.on_duplicate_key_update(
+            dict(map(lambda x: (x[0], func.coalesce(cls.__table__.c[x[0]], 0) + x[1]), values.items()))
+        )
+        db.session.execute(statement)
 
-    def is_same_notification(self, user_id, category, question_id=None) -> list:
-        # in case of 'follow'
-        if category == NotificationCategory.follow:
-            return list(
-                filter(lambda x: x.passive_id == user_id and x.category == category, self.active_notifications))
-        # in case of 'answer'
-        elif category == NotificationCategory.answer and question_id:
-            return list(
-                filter(
-                    lambda x: x.passive_id == user_id and x.category == category and x.question_id == question_id,
-                    self.active_notifications))
+    @classmethod
+    def count_participants(cls, period: str) -> int:
+        column = cls.get_column(period)
+        return db.session.query(func.count(column)).filter(column.is_not(None)).scalar()
+
+    @classmethod
+    def find_participants(cls, period: str) -> int:
+        """Participants counted by the last batch. (counted now only if the batch has never run)"""
+        participants = db.session.query(ranking_summary.c.participants) \
+            .filter(ranking_summary.c.name == f"{cls.metric}_{period}") \
+            .scalar()
+        return cls.count_participants(period) if participants is None else participants
 
+    @classmethod
+    def build_ranking(cls, period: str) -> list[dict]:
+        """Top RANKING_SIZE users of the period. (without is_following)"""
+        column = cls.get_column(period)
+        objects = db.session.query(column.label("value"), User) \
+            .join(User, User.id == cls.user_id) \
+            .filter(column.is_not(None)) \
+            .order_by(column.desc()) \
+            .order_by(User.id.desc()) \
+            .limit(RANKING_SIZE) \
+            .all()
+        return list(map(lambda x: x[1].User.to_profile_dict() | {
+            "rank": x[0] + 1,
+            cls.metric: x[1].value
+        }, enumerate(objects)))
+
+    @classmethod
+    def publish_snapshot(cls, period: str) -> None:
+        """Publish the ranking. the generation (the ETag) counts up only when the payload changed.
+        (MySQL assigns in order, so the generation is compared with the payload before it's updated)
+        """
+        statement = insert(ranking_snapshot).values(name=f"{cls.metric}_{period}", generation=1,
+                                                    payload=cls.build_ranking(period), published_at=datetime.now())
+        statement = statement.on_duplicate_key_update([
+            ("generation", func.if_(ranking_snapshot.c.payload == statement.inserted.payload,
+                                    ranking_snapshot.c.generation, ranking_snapshot.c.generation + 1)),
+            ("payload", statement.inserted.payload),
+            ("published_at", statement.inserted.published_at),
+        ])
+        db.session.execute(statement)
+
+    @classmethod
+    def find_snapshot(cls, period: str):
+        """(name, generation, payload, published_at) of the period, published by 'flask ranking_refresh'.
+        Read only. (built on the fly, without a generation, if it has never been published)
+        """
+        name = f"{cls.metric}_{period}"
+        snapshot = db.session.query(ranking_snapshot).filter(ranking_snapshot.c.name == name).first()
+        if not snapshot:
+            return SimpleNamespace(name=name, generation=0, payload=cls.build_ranking(period),
+                                   published_at=datetime.now())
+        return snapshot
+
+    def rank_of(self, period: str) -> int or None:
+        column = self.get_column(period)
+        value = getattr(self, column.name)
+        if value is None:
+            return None
+        higher_count: int = db.session.query(func.count(column)) \
+            .filter(or_(column > value, and_(column == value, self.__table__.c.user_id > self.user_id))) \
+            .scalar()
+        return higher_count + 1
+
+    def get_period(self, period: str, participants: int = None) -> list or None:
+        """[rank, value] of the period. the live rank is clamped to the participants counted by the batch,
+        since the users joined after the count are ranked too.
+        """
+        value = getattr(self, self.get_column(period).name)
+        if not period == "total" and not value:
+            return None
+        rank = self.rank_of(period)
+        if rank is not None and participants:
+            rank = min(rank, participants)
+        return [rank, value]
+
+    # must be exists.
+    @property
+    def get_total(self) -> list:
+        return self.get_period("total")
+
+    @property
+    def get_month(self) -> list or None:
+        return self.get_period("month")
 
-class PointStats(db.Model):
+    @property
+    def get_week(self) -> list or None:
+        return self.get_period("week")
+
+
+class PointStats(RankingStats, db.Model):
     """PointStats
-    Mainly for all users ranking of points, that is aggregated by batch.
+    Mainly for all users ranking of points, that is updated on every answer.
     """
+    __table_args__ = (
+        Index('point_stats_total_point_index', 'total_point', 'user_id'),
+        Index('point_stats_month_point_index', 'month_point', 'user_id'),
+        Index('point_stats_week_point_index', 'week_point', 'user_id'),
+        {}
+    )
+    metric = "point"
+
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), unique=True)
-    total_rank = Column(Integer, nullable=False)
     total_point = Column(Integer, nullable=False)
-    month_rank = Column(Integer, default=None)
     month_point = Column(Integer, default=None)
-    week_rank = Column(Integer, default=None)
     week_point = Column(Integer, default=None)
 
+    # total count of each result. (for the period of total, instead of summing all the rollups)
+    right_count = Column(Integer, nullable=False, default=0)
+    first_count = Column(Integer, nullable=False, default=0)
+    wrong_count = Column(Integer, nullable=False, default=0)
+    even_count = Column(Integer, nullable=False, default=0)
+
     def to_dict(self) -> dict:
         return {
             "id": self.id,
             "user_id": self.user_id,
-            "total_rank": self.total_rank,
-            "month_rank": self.month_rank,
-            "week_rank": self.week_rank,
+            "total_rank": self.rank_of("total"),
+            "month_rank": self.rank_of("month"),
+            "week_rank": self.rank_of("week"),
             "total_point": self.total_point,
             "month_point": self.month_point,
             "week_point": self.week_point,
@@ -300,72 +576,100 @@ class PointStats(db.Model):
     def find_by_user_id(cls, user_id: int) -> "PointStats":
         return cls.query.filter_by(user_id=user_id).first()
 
-    # must be exists.
-    @property
-    def get_total(self) -> list:
-        result = [self.total_rank, self.total_point]
-        return result
-
-    @property
-    def get_month(self) -> list or None:
-        result = [self.month_rank, self.month_point]
-        if not result[0] or not result[1]:
-            return None
-        return result
-
-    @property
-    def get_week(self) -> list or None:
-        result = [self.week_rank, self.week_point]
-        if not result[0] or not result[1]:
-            return None
-        return result
+    @classmethod
+    def apply(cls, user_id: int, delta: int, **increments) -> None:
+        super().apply(user_id, delta, **{POINT_CATEGORY_COLUMNS[AnswerResultPoint(delta)]: 1} | increments)
 
 
-class ResponseStats(db.Model):
+class ResponseStats(RankingStats, db.Model):
     """ResponseStats
-    Mainly for all users ranking of response, that is aggregated by batch.
+    Mainly for all users ranking of response, that is updated on every answer.
     """
+    __table_args__ = (
+        Index('response_stats_total_response_index', 'total_response', 'user_id'),
+        Index('response_stats_month_response_index', 'month_response', 'user_id'),
+        Index('response_stats_week_response_index', 'week_response', 'user_id'),
+        {}
+    )
+    metric = "response"
+
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), unique=True)
-    total_rank = Column(Integer, nullable=False)
     total_response = Column(Integer, nullable=False)
-    month_rank = Column(Integer, default=None)
     month_response = Column(Integer, default=None)
-    week_rank = Column(Integer, default=None)
     week_response = Column(Integer, default=None)
 
     def to_dict(self) -> dict:
         return {
             "id": self.id,
             "user_id": self.user_id,
-            "total_rank": self.total_rank,
-            "month_rank": self.month_rank,
-            "week_rank": self.week_rank,
-            "total_response": self.total_point,
-            "month_response": self.month_point,
-            "week_response": self.week_point,
+            "total_rank": self.rank_of("total"),
+            "month_rank": self.rank_of("month"),
+            "week_rank": self.rank_of("week"),
+            "total_response": self.total_response,
+            "month_response": self.month_response,
+            "week_response": self.week_response,
         }
 
     @classmethod
     def find_by_user_id(cls, user_id: int) -> "ResponseStats":
         return cls.query.filter_by(user_id=user_id).first()
 
-    # must be exists.
-    @property
-    def get_total(self) -> list:
-        result = [self.total_rank, self.total_response]
-        return result
 
-    @property
-    def get_month(self) -> list or None:
-        result = [self.month_rank, self.month_response]
-        if not result[0] or not result[1]:
-            return None
-        return result
+class UserCounters(db.Model):
+    """UserCounters
+    Denormalized counts of the user, updated in the same transaction as the rows they count.
+    Drift (ex: cascaded deletes) is repaired by 'flask counters_reconcile' in batch.py.
+    """
+    __table_args__ = (
+        Index('user_counters_followers_index', 'followers', 'user_id'),
+        {}
+    )
 
-    @property
-    def get_week(self) -> list or None:
-        result = [self.week_rank, self.week_response]
-        if not result[0] or not result[1]:
-            return None
-        return result
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    followers = Column(Integer, nullable=False, default=0)
+    followings = Column(Integer, nullable=False, default=0)
+    questions = Column(Integer, nullable=False, default=0)
+    answers = Column(Integer, nullable=False, default=0)
+    unread_notifications = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "following_count": self.followings,
+            "follower_count": self.followers,
+            "questions_count": self.questions,
+            "answers_count": self.answers,
+        }
+
+    @classmethod
+    def find_by_user_id(cls, user_id: int) -> "UserCounters":
+        return cls.query.filter_by(user_id=user_id).first()
+
+    @classmethod
+    def add(cls, user_id: int, **deltas) -> None:
+        """Add the deltas to the counters. (ex: UserCounters.add(user.id, followers=1))"""
+        statement = insert(cls.__table__).values(
+            {"user_id": user_id} | dict(map(lambda x: (x[0], max(x[1], 0)), deltas.items())))
+        statement = statement.on_duplicate_key_update(
+            dict(map(lambda x: (x[0], cls.__table__.c[x[0]] + x[1]), deltas.items())))
+        db.session.execute(statement)
+
+    @classmethod
+    def remove_notifications_of(cls, question_id: int) -> None:
+        """Count down the unread notifications of the question. (before they are deleted)"""
+        unread = db.session.query(Notification.passive_id, func.count(Notification.id).label("unread_count")) \
+            .filter(Notification.question_id == question_id) \
+            .filter(Notification.watched.is_(False)) \
+            .group_by(Notification.passive_id) \
+            .subquery()
+        db.session.execute(cls.__table__.update()
+                           .where(cls.__table__.c.user_id == unread.c.passive_id)
+                           .values(unread_notifications=cls.__table__.c.unread_notifications - unread.c.unread_count))
+
+    @classmethod
+    def remove_answers_to(cls, question_id: int) -> None:
+        """Count down the answers of the users who answered the question. (before the question is deleted)"""
+        db.session.execute(cls.__table__.update()
+                           .where(cls.__table__.c.user_id == answer.c.user_id)
+                           .where(answer.c.question_id == question_id)
+                           .values(answers=cls.__table__.c.answers - 1))
@@ -1,29 +1,42 @@
+from flask import request, Response
 from flask_jwt_extended import current_user, jwt_required
-from flask_restx import Namespace, Resource
+from flask_restx import Namespace, Resource, fields
+
+from api.libs.pagination import CURSOR_PARAMS, is_cursor_request, cursor_response
 from api.model.others import Notification
 from api.model.user import User
 from database import db
 
 notification_ns = Namespace('/notifications')
 
+notificationWatch = notification_ns.model('NotificationWatch', {
+    'up_to_id': fields.Integer(required=False, description='Only the notifications up to this id. (all if omitted)'),
+})
+
 
 @notification_ns.route('')
 class NotificationIndex(Resource):
     @notification_ns.doc(
         security='jwt_auth',
-        doc="Get all my notifications."
+        doc="Get all my notifications.",
+        params=CURSOR_PARAMS | {'unread': {'type': 'bool', 'description': 'Only the unread notifications.'}}
     )
     @jwt_required()
     def get(self):
-        objects = db.session.query(Notification, User) \
+        base_query = db.session.query(Notification, User) \
             .filter(Notification.passive_id == current_user.id) \
-            .join(User, User.id == Notification.active_id) \
+            .join(User, User.id == Notification.active_id)
+        if request.args.get("unread") in ["1", "true"]:
+            base_query = base_query.filter(Notification.watched.is_(False))
+        if is_cursor_request():
+            return cursor_response(base_query, [Notification.id], lambda x: [x.Notification.id],
+                                   Notification.to_dict_list)
+
+        objects = base_query \
             .order_by(Notification.id.desc()) \
             .all()
 
-        return list(map(lambda x: x.Notification.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+        return Notification.to_dict_list(objects)
 
     @notification_ns.doc(
         security='jwt_auth',
@@ -31,17 +44,34 @@ class NotificationIndex(Resource):
     )
     @jwt_required()
     def delete(self):
-        Notification.query.filter_by(passive_id=current_user.id).delete()
+        current_user.delete_notifications()
         db.session.commit()
         return dict(status=200, message="successfully deleted")
 
     @notification_ns.doc(
         security='jwt_auth',
-        doc="Change statuses of my notifications to watched"
+        doc="Change statuses of my notifications to watched",
+        body=notificationWatch
     )
     @jwt_required()
     def put(self):
-        for notification in current_user.passive_notifications:
-            notification.watched = True
+        params = request.get_json(silent=True) or {}
+        watched_count = current_user.watch_notifications(params.get("up_to_id"))
         db.session.commit()
-        return dict(status=200, message="successfully changed status to 'watched'")
+        return dict(status=200, message="successfully changed status to 'watched'", watched_count=watched_count)
+
+
+@notification_ns.route('/unread_count')
+class NotificationUnreadCount(Resource):
+    @notification_ns.doc(
+        security='jwt_auth',
+        doc="Get the count of my unread notifications. "
+            "Poll it with If-None-Match, and 304 (no body) is returned while the count is not changed."
+    )
+    @jwt_required()
+    def get(self):
+        unread_count: int = current_user.unread_notifications_count
+        etag = f"unread-{unread_count}"
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"})
+        return {"unread_count": unread_count}, 200, {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
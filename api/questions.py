@@ -4,13 +4,14 @@ from flask import request
 
 from flask_restx import Namespace, fields, Resource
 from flask_jwt_extended import jwt_required, current_user
-from sqlalchemy import func
 
-from api.model.aggregate import point, response
+from api.libs.pagination import CURSOR_PARAMS, is_cursor_request, cursor_response
 from api.model.enum.enums import AnswerResultPoint, QuestionOption
 from api.model.others import Notification
-from api.model.question import Question, answer
-from api.model.user import User
+from api.model.outbox import append_event, OUTBOX_ANSWER_CREATED
+from api.model.question import Question, QuestionTally, answer, bookmark
+from api.model.timeline import fan_out_question, timeline_query
+from api.model.user import User, UserCounters
 from database import db
 
 question_ns = Namespace('/questions')
@@ -39,17 +40,21 @@ answerCreateModel = question_ns.model('BookmarkCreate', {
 class QuestionIndex(Resource):
     @question_ns.doc(
         security='jwt_auth',
-        description='Get all questions.',
-        params={'page': {'type': 'str'}}
+        description='Get all questions. (* cursor mode if "after" or "limit" is given, instead of "page".)',
+        params=dict({'page': {'type': 'str'}}, **CURSOR_PARAMS)
     )
     @jwt_required()
     def get(self):
+        base_query = db.session.query(Question, User) \
+            .join(User)
+        if is_cursor_request():
+            return cursor_response(base_query, [Question.id], lambda x: [x.Question.id], Question.to_dict_list)
+
         page: int = int(request.args.get('page'))
         if not page:
             return {"message": "Bad Request."}, 400
 
-        base_query = db.session.query(Question, User) \
-            .join(User) \
+        base_query = base_query \
             .order_by(Question.id.desc()) \
             .paginate(page=page, per_page=15, error_out=False)
 
@@ -57,9 +62,7 @@ class QuestionIndex(Resource):
         total_pages = base_query.pages
         objects = base_query.items
 
-        questions = list(map(lambda x: x.Question.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+        questions = Question.to_dict_list(objects)
 
         return {"data": {
             "questions": questions,
@@ -88,8 +91,13 @@ class QuestionIndex(Resource):
         )
 
         db.session.add(question)
+        db.session.flush()
+        fan_out_question(question)
+        UserCounters.add(current_user.id, questions=1)
         db.session.commit()
         db.session.refresh(question)
+        current_user.load_membership("answered_questions", [question.id])
+        current_user.load_membership("bookmarks", [question.id])
 
         return {"status": 201, "message": "the question created.", "data": question.to_dict()}, 201
 
@@ -106,8 +114,11 @@ class QuestionIndex(Resource):
             return {"status": 401, "message": "Unauthorized operation."}, 401
 
         # delete notification
+        UserCounters.remove_notifications_of(question.id)
         Notification.query.filter_by(question_id=question_id).delete()
 
+        UserCounters.remove_answers_to(question.id)
+        UserCounters.add(current_user.id, questions=-1)
         db.session.delete(question)
         db.session.commit()
 
@@ -127,23 +138,17 @@ class QuestionsAnswer(Resource):
         question = Question.find_by_id(params["question_id"])
         if not question:
             return {"status": 404, "message": "Not Found"}, 404
+        current_user.load_membership("answered_questions", [question.id])
         if question.user_id == current_user.id or current_user.is_answered_question(question):
             return {"status": 400, "message": "Bad request"}, 400
 
-        # attention that below method is the 'Dynamic'. So it should be got by the 'all()' method finally.
-        if not question.answered_users.all():
+        counts: dict = QuestionTally.find_counts(question.id)
+        if not counts["total"]:
             result_point: int = AnswerResultPoint.FIRST.value
 
         else:
-            first_count: int = len(db.session.query(answer)
-                                   .filter(answer.c.question_id == params["question_id"])
-                                   .filter(answer.c.option == QuestionOption.first.value)
-                                   .all())
-
-            second_count: int = len(db.session.query(answer)
-                                    .filter(answer.c.question_id == params["question_id"])
-                                    .filter(answer.c.option == QuestionOption.second.value)
-                                    .all())
+            first_count: int = counts["first"]
+            second_count: int = counts["second"]
             if params["option"] == QuestionOption.first.value:
                 first_count += 1
                 if first_count == second_count:
@@ -169,21 +174,12 @@ class QuestionsAnswer(Resource):
         )
         db.session.execute(insert_answer)
 
-        # create point
-        insert_point = point.insert().values(
-            user_id=current_user.id,
-            point=result_point
-        )
-        db.session.execute(insert_point)
-
-        # create response
-        insert_response = response.insert().values(
-            user_id=question.user_id,
-        )
-        db.session.execute(insert_response)
+        # count up the tally in the same transaction
+        QuestionTally.increment(question.id, current_user.id, params["option"])
 
-        # create notifications
-        current_user.create_answer_notification(question)
+        # points, responses, counters and notification are done by the worker.
+        append_event(OUTBOX_ANSWER_CREATED, user_id=current_user.id, question_id=question.id,
+                     question_user_id=question.user_id, result_point=result_point)
 
         # commit
         db.session.commit()
@@ -204,6 +200,9 @@ class QuestionShow(Resource):
         if not question:
             return {"status": 404, "message": "Not Found"}, 404
 
+        current_user.load_membership("answered_questions", [question.id])
+        current_user.load_membership("bookmarks", [question.id])
+        current_user.load_membership("followings", [question.user_id])
         return question.to_dict() | {
             "user": question.user.to_dict()
         }
@@ -221,21 +220,14 @@ class QuestionOwner(Resource):
         question: Question or None = Question.query.filter_by(id=question_id).first()
         if not question:
             return {"status": 404, "message": "Not Found"}, 404
-        elif not question.user_id == current_user.id and not current_user.is_answered_question(question):
+        current_user.load_membership("answered_questions", [question.id])
+        if not question.user_id == current_user.id and not current_user.is_answered_question(question):
             return {"status": 403, "message": "Forbidden"}, 403
 
         # Aggregate each options count.
-        first_count: int = len(db.session.query(answer)
-                               .filter(answer.c.question_id == question_id)
-                               .filter(answer.c.option == QuestionOption.first.value)
-                               .all())
+        counts: dict = QuestionTally.find_counts(question.id)
 
-        second_count: int = len(db.session.query(answer)
-                                .filter(answer.c.question_id == question_id)
-                                .filter(answer.c.option == QuestionOption.second.value)
-                                .all())
-
-        count_data: list = [first_count, second_count]
+        count_data: list = [counts["first"], counts["second"]]
 
         # Get answered users and their options.
         objects: list = db.session.query(User, answer.c.option.label("option")) \
@@ -244,6 +236,7 @@ class QuestionOwner(Resource):
             .order_by(answer.c.created_at.desc()) \
             .all()
 
+        current_user.load_membership("followings", list(map(lambda x: x.User.id, objects)))
         users: list = list(map(lambda x: x.User.to_dict() | {
             "option": x.option
         }, objects))
@@ -260,14 +253,7 @@ class QuestionNext(Resource):
     )
     @jwt_required()
     def get(self):
-        answered_question_ids: list[int] = list(map(lambda x: x.id, current_user.answered_questions))
-        owner_question_ids: list[int] = list(map(lambda x: x.id, current_user.questions))
-
-        question: Question or None = Question.query \
-            .filter(Question.id.notin_(answered_question_ids + owner_question_ids)) \
-            .order_by(func.rand()) \
-            .limit(1) \
-            .first()
+        question: Question or None = Question.find_random_answerable(current_user.id)
         if not question:
             return {"message": "none", "data": None}, 200
         return {"message": "ok", "data": question.id}, 200
@@ -278,41 +264,45 @@ class QuestionTimeline(Resource):
     @question_ns.doc(
         security='jwt_auth',
         description='Get a questions of timeline (related with following users.)',
-        params={'page': {'type': 'str'}}
+        params=dict({'page': {'type': 'str'}}, **CURSOR_PARAMS)
     )
     @jwt_required()
     def get(self):
-        page = int(request.args.get("page"))
+        base_query = timeline_query(current_user.id)
+        if is_cursor_request():
+            return cursor_response(base_query, [Question.id], lambda x: [x.Question.id], Question.to_dict_list)
 
-        following_ids = [current_user.id]
-        for user in current_user.followings:
-            following_ids.append(user.id)
-
-        objects = db.session.query(Question, User) \
-            .filter(Question.user_id.in_(following_ids)) \
-            .join(User) \
+        page = int(request.args.get("page"))
+        objects = base_query \
             .order_by(Question.id.desc()) \
             .paginate(page=page, per_page=15, error_out=False) \
             .items
 
-        return list(map(lambda x: x.Question.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+        return Question.to_dict_list(objects)
 
 
 @question_ns.route('/bookmark')
 class QuestionBookmark(Resource):
     @question_ns.doc(
         security='jwt_auth',
-        description='Get bookmarked questions. (current_user)'
+        description='Get bookmarked questions. (current_user)',
+        params=CURSOR_PARAMS
     )
     @jwt_required()
     def get(self):
-        objects = current_user.bookmarks.join(User).all()
+        base_query = db.session.query(Question, User, bookmark.c.created_at.label("bookmarked_at")) \
+            .join(bookmark, bookmark.c.question_id == Question.id) \
+            .filter(bookmark.c.user_id == current_user.id) \
+            .join(User, User.id == Question.user_id)
+        if is_cursor_request():
+            return cursor_response(base_query, [bookmark.c.created_at, bookmark.c.question_id],
+                                   lambda x: [x.bookmarked_at, x.Question.id], Question.to_dict_list)
+
+        objects = base_query \
+            .order_by(bookmark.c.created_at.desc()) \
+            .all()
 
-        return list(map(lambda x: x.Question.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+        return Question.to_dict_list(objects)
 
     @question_ns.doc(
         security='jwt_auth',
@@ -327,6 +317,7 @@ class QuestionBookmark(Resource):
         if not question:
             return {"status": 400, "message": "bad request"}, 400
 
+        current_user.load_membership("bookmarks", [question.id])
         current_user.bookmark_question(question)
         db.session.commit()
 
@@ -345,6 +336,7 @@ class QuestionBookmark(Resource):
         if not question:
             return {"status": 400, "message": "bad request"}, 400
 
+        current_user.load_membership("bookmarks", [question.id])
         current_user.un_bookmark_question(question)
         db.session.commit()
 
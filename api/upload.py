@@ -1,30 +1,44 @@
 import base64
 import datetime
 import http
-import os
-import tempfile
+import re
 import traceback
+from functools import partial
 from random import randrange
+from typing import Optional
+from uuid import uuid4
 
-import boto3
-from io import BytesIO
-
-from PIL import Image
-from flask import request
+from botocore.exceptions import ClientError
+from flask import request, current_app
 from flask_jwt_extended import jwt_required, current_user
-from flask_restx import Namespace, Resource
-
+from flask_restx import Namespace, Resource, fields
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from api.libs.avatar import AvatarException, avatar_pool, check_image, delete_avatar, presign_upload, \
+    render_avatar, render_staged_avatar, staging_key
+from api.libs.s3 import S3
+from api.libs.user_cache import user_identities
+from api.model.outbox import enqueue_object_deletions
+from api.model.user import User
 from database import db
 
 upload_ns = Namespace('/upload', description="* Masked(can`t open)")
 
+upload_id_regex = r'^[0-9a-f]{32}$'
+
+avatarConfirm = upload_ns.model('AvatarConfirm', {
+    'upload_id': fields.String(pattern=upload_id_regex, required=True)
+})
+
 
 @upload_ns.route('')
 class UploadUserAvatar(Resource):
     @upload_ns.hide
     @upload_ns.doc(
         security='jwt_auth',
-        description='Upload avatar to S3.'
+        description='Upload avatar to S3. '
+                    '(body: the image binary with "Content-Type: image/*", multipart "image" file, '
+                    'or base64 data URL in the form "image")'
     )
     @jwt_required()
     def post(self):
@@ -32,56 +46,27 @@ class UploadUserAvatar(Resource):
             return {"message": "invalid request"}, http.HTTPStatus.BAD_REQUEST
 
         try:
-            with tempfile.NamedTemporaryFile() as temp_image_file:
-                client = boto3.client("s3")
-
-                # only string binary data
-                base64_png = request.form['image']
-                if type(base64_png) is not str:
-                    return {"message": "invalid request"}, http.HTTPStatus.BAD_REQUEST
-
-                # decode
-                code = base64.b64decode(base64_png.split(',')[1])
-
-                # if valid image format, "UnidentifiedImageError" occur
-                image = Image.open(BytesIO(code))
-
-                # sizing
-                image = scale_to_width(image=image, width=170)
-
-                # if image is broken, error occur
-                image.verify()
-
-                # save in temp_file
-                image.save(temp_image_file, "PNG")
-
-                # seek
-                temp_image_file.seek(0)
-
-                now = datetime.datetime.now()
-                filename = now.strftime('%Y%m%d_%H%M%S_%f') + str(current_user.id) + ".png"
-                stream = temp_image_file
-
-                # upload
-                client.upload_fileobj(
-                    Fileobj=stream,
-                    Bucket=os.getenv("AWS_BUCKET_NAME"),
-                    Key=f'{os.getenv("AWS_PATH_KEY")}{filename}',
-                    ExtraArgs={"ACL": "public-read", "ContentType": "image/png"}
-                )
-
-                # delete if avatar name not! include "egg"
-                if "egg" not in current_user.avatar:
-                    client.delete_object(
-                        Bucket=os.getenv("AWS_BUCKET_NAME"),
-                        Key=f'{os.getenv("AWS_PATH_KEY")}{current_user.avatar}'
-                    )
-
-                # save
-                current_user.avatar = filename
-                db.session.commit()
-
-            return {"message": "success"}, 201
+            # raw binary, multipart or base64 data URL (* compatibility)
+            data = get_image_data()
+            if not data:
+                return {"message": "invalid request"}, http.HTTPStatus.BAD_REQUEST
+
+            # reject the unsupported formats and decompression bombs by the header.
+            check_image(data, current_app.config['AVATAR_MAX_PIXELS'])
+
+            filename = avatar_filename(current_user.id)
+
+            # resized and uploaded in the pool. "avatar" is updated when it's done.
+            callback = partial(update_avatar, current_app._get_current_object(), current_user.id, None)
+            if not avatar_pool.submit(current_app.config, callback, render_avatar, data, filename,
+                                      current_app.config['AVATAR_MAX_PIXELS']):
+                return {"message": "Too many uploads now. please try again later."}, 503
+
+            return {"message": "accepted", "avatar": filename}, 202
+        except AvatarException as e:
+            return {"message": str(e)}, http.HTTPStatus.BAD_REQUEST
+        except RequestEntityTooLarge:
+            return {"message": "The image is too large."}, http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE
         except:
             traceback.print_exc()
             return {"message": "Internal server error. Failed to upload the avatar."}, 500
@@ -94,22 +79,121 @@ class UploadUserAvatar(Resource):
     @jwt_required()
     def put(self):
         try:
-            if "egg" not in current_user.avatar:
-                client = boto3.client("s3")
-                client.delete_object(
-                    Bucket=os.getenv("AWS_BUCKET_NAME"),
-                    Key=f'{os.getenv("AWS_PATH_KEY")}{current_user.avatar}'
-                )
+            delete_avatar(current_user.avatar)
             avatar: str = f"egg_{randrange(1, 11)}.png"
             current_user.avatar = avatar
             db.session.commit()
+            user_identities.invalidate(current_user.id)
             return {"message": "ok"}, 200
         except:
             traceback.print_exc()
             return {"message": "Internal server error. Failed to reset the avatar."}, 500
 
 
-# Sustain aspect ratio.
-def scale_to_width(image, width):
-    height = round(image.height * width / image.width)
-    return image.resize((width, height))
+@upload_ns.route('/presigned')
+class UploadPresigned(Resource):
+    @upload_ns.hide
+    @upload_ns.doc(
+        security='jwt_auth',
+        description='Issue a presigned POST to upload the avatar directly to S3. '
+                    '(POST "fields" and the "file" to "url" as multipart, then confirm with "upload_id")'
+    )
+    @jwt_required()
+    def post(self):
+        try:
+            upload_id: str = uuid4().hex
+            presigned: dict = presign_upload(current_user.id, upload_id,
+                                             current_app.config['AVATAR_UPLOAD_MAX_BYTES'],
+                                             current_app.config['AVATAR_UPLOAD_EXPIRES_SECONDS'])
+            return {"upload_id": upload_id, "url": presigned["url"], "fields": presigned["fields"]}, 200
+        except:
+            traceback.print_exc()
+            return {"message": "Internal server error. Failed to issue the upload."}, 500
+
+
+@upload_ns.route('/confirm')
+class UploadConfirm(Resource):
+    @upload_ns.hide
+    @upload_ns.doc(
+        security='jwt_auth',
+        body=avatarConfirm,
+        description='Process the avatar uploaded by the presigned POST, and swap it in. (202: in progress)'
+    )
+    @jwt_required()
+    def post(self):
+        upload_id = (request.get_json(silent=True) or {}).get("upload_id")
+        if type(upload_id) is not str or not re.match(upload_id_regex, upload_id):
+            return {"message": "invalid request"}, http.HTTPStatus.BAD_REQUEST
+
+        key: str = staging_key(current_user.id, upload_id)
+        try:
+            S3.get_client().head_object(Bucket=S3.AWS_BUCKET_NAME, Key=key)
+        except ClientError:
+            return {"message": "The upload was not found."}, http.HTTPStatus.NOT_FOUND
+
+        try:
+            filename = avatar_filename(current_user.id)
+            callback = partial(update_avatar, current_app._get_current_object(), current_user.id, key)
+            if not avatar_pool.submit(current_app.config, callback, render_staged_avatar, key, filename,
+                                      current_app.config['AVATAR_MAX_PIXELS']):
+                return {"message": "Too many uploads now. please try again later."}, 503
+
+            return {"message": "accepted", "avatar": filename}, 202
+        except:
+            traceback.print_exc()
+            return {"message": "Internal server error. Failed to upload the avatar."}, 500
+
+
+def avatar_filename(user_id: int) -> str:
+    now = datetime.datetime.now()
+    return now.strftime('%Y%m%d_%H%M%S_%f') + str(user_id) + ".png"
+
+
+def get_image_data() -> Optional[bytes]:
+    """Bytes of the uploaded image, or None.
+    The raw binary is read from the request stream. (not copied by the form parser)
+    The stream isn't limited by MAX_CONTENT_LENGTH like the form parser, so it's checked here. (RequestEntityTooLarge)
+    """
+    if request.mimetype.startswith("image/"):
+        max_length: int = current_app.config['MAX_CONTENT_LENGTH']
+        if request.content_length is not None and request.content_length > max_length:
+            raise RequestEntityTooLarge()
+        # the length can be missing (chunked), so read one byte over the limit at most.
+        data = request.stream.read(max_length + 1)
+        if len(data) > max_length:
+            raise RequestEntityTooLarge()
+        return data
+    if "image" in request.files:
+        return request.files["image"].read()
+
+    # only string binary data
+    base64_png = request.form.get("image")
+    if type(base64_png) is not str or "," not in base64_png:
+        return None
+    return base64.b64decode(base64_png.split(',')[1])
+
+
+def update_avatar(app, user_id: int, key: Optional[str], future) -> None:
+    """Save the avatar uploaded by the pool, and delete the previous one and the staged original.
+    (called in a thread of the pool)
+    """
+    with app.app_context():
+        if key:
+            enqueue_object_deletions([key])
+        if future.exception():
+            app.logger.error(f"Failed to process the avatar of the user {user_id}: {future.exception()!r}")
+            db.session.commit()
+            return
+
+        # locked, so the callbacks of the uploads one after another are serialized.
+        user = User.query.filter_by(id=user_id).with_for_update().first()
+        # the names start with the time of the upload. not newer than the current one: a later upload finished first.
+        is_outdated = user and "egg" not in user.avatar and future.result() <= user.avatar
+        if not user or user.is_deleted or is_outdated:
+            delete_avatar(future.result())
+            db.session.commit()
+            return
+        delete_avatar(user.avatar)
+        user.avatar = future.result()
+        db.session.commit()
+        user_identities.invalidate(user_id)
@@ -1,16 +1,17 @@
 import http
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 
-from flask import request
+from flask import request, Response
 from flask_jwt_extended import jwt_required, current_user
 from flask_restx import Resource, Namespace, fields
 from sqlalchemy import func
 
-from api.model.aggregate import point
-from api.model.enum.enums import NotificationCategory
-from api.model.others import SearchHistory, Notification, user_relationship
+from api.libs.pagination import CURSOR_PARAMS, MAX_LIMIT, is_cursor_request, cursor_response
+from api.model.aggregate import point_daily, POINT_CATEGORY_COLUMNS
+from api.model.others import SearchHistory, user_relationship
 from api.model.question import Question, answer, bookmark
-from api.model.user import User, PointStats, ResponseStats
+from api.model.search import search_user_query
+from api.model.user import User, UserCounters, PointStats, ResponseStats, RANKING_PERIODS, RANKING_WINDOWS
 from database import db
 
 user_ns = Namespace('/users')
@@ -41,11 +42,8 @@ class UserShow(Resource):
         if not user:
             return {'status': 404, 'message': 'the page you want was not found.'}, 404
 
-        user_dict = user.to_dict() | {
-            "following_count": len(user.followings),
-            "follower_count": len(user.follower),
-            "questions_count": len(user.questions.all()),
-        }
+        current_user.load_membership("followings", [user.id])
+        user_dict = user.to_dict() | user.counters_dict
 
         return user_dict
 
@@ -55,16 +53,20 @@ class UserShow(Resource):
 class UserQuestions(Resource):
     @user_ns.doc(
         security='jwt_auth',
-        description='Get questions by user_id'
+        description='Get questions by user_id',
+        params=CURSOR_PARAMS
     )
     @jwt_required()
     def get(self, user_id):
-        objects = db.session.query(Question, User).filter(Question.user_id == user_id) \
+        base_query = db.session.query(Question, User).filter(Question.user_id == user_id) \
+            .join(User)
+        if is_cursor_request():
+            return cursor_response(base_query, [Question.id], lambda x: [x.Question.id], Question.to_dict_list)
+
+        objects = base_query \
             .order_by(Question.id.desc()) \
-            .join(User).all()
-        return list(map(lambda x: x.Question.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+            .all()
+        return Question.to_dict_list(objects)
 
 
 @user_ns.route('/<user_id>/questions/answered')
@@ -72,25 +74,28 @@ class UserQuestionsAnswered(Resource):
     @user_ns.doc(
         security='jwt_auth',
         description='Get answered questions by user_id',
-        params={'page': {'type': 'str'}}
+        params=dict({'page': {'type': 'str'}}, **CURSOR_PARAMS)
     )
     @jwt_required()
     def get(self, user_id):
+        base_query = db.session.query(Question, User, answer.c.created_at.label("answered_at")) \
+            .join(answer, answer.c.question_id == Question.id) \
+            .filter(answer.c.user_id == user_id) \
+            .join(User, User.id == Question.user_id)
+        if is_cursor_request():
+            return cursor_response(base_query, [answer.c.created_at, answer.c.question_id],
+                                   lambda x: [x.answered_at, x.Question.id], Question.to_dict_list)
+
         page: int = int(request.args.get('page'))
         if not page:
             return {"message": "Bad Request."}, 400
 
-        objects = db.session.query(Question, User) \
-            .join(answer, answer.c.question_id == Question.id) \
-            .filter(answer.c.user_id == user_id) \
-            .join(User, User.id == Question.user_id) \
+        objects = base_query \
             .order_by(answer.c.created_at.desc()) \
             .paginate(page=page, per_page=15, error_out=False) \
             .items
 
-        return list(map(lambda x: x.Question.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+        return Question.to_dict_list(objects)
 
 
 @user_ns.route('/<user_id>/questions/bookmark')
@@ -98,29 +103,32 @@ class UserQuestionsBookmarked(Resource):
     @user_ns.doc(
         security='jwt_auth',
         description='Get bookmarked questions by user_id. (*only access for current_user)',
-        params={'page': {'type': 'str'}}
+        params=dict({'page': {'type': 'str'}}, **CURSOR_PARAMS)
     )
     @jwt_required()
     def get(self, user_id):
-        page: int = int(request.args.get('page'))
-        if not page:
-            return {"message": "Bad Request."}, 400
-
         # path parameters are treated as 'string'. So it is needed to casting to 'int'.
         if not current_user.id == int(user_id):
             return {"status": 404, "message": "Not found."}, 404
 
-        objects = db.session.query(Question, User) \
+        base_query = db.session.query(Question, User, bookmark.c.created_at.label("bookmarked_at")) \
             .join(bookmark, bookmark.c.question_id == Question.id) \
             .filter(bookmark.c.user_id == user_id) \
-            .join(User, User.id == Question.user_id) \
+            .join(User, User.id == Question.user_id)
+        if is_cursor_request():
+            return cursor_response(base_query, [bookmark.c.created_at, bookmark.c.question_id],
+                                   lambda x: [x.bookmarked_at, x.Question.id], Question.to_dict_list)
+
+        page: int = int(request.args.get('page'))
+        if not page:
+            return {"message": "Bad Request."}, 400
+
+        objects = base_query \
             .order_by(bookmark.c.created_at.desc()) \
             .paginate(page=page, per_page=15, error_out=False) \
             .items
 
-        return list(map(lambda x: x.Question.to_dict() | {
-            "user": x.User.to_dict()
-        }, objects))
+        return Question.to_dict_list(objects)
 
 
 # Follow
@@ -128,48 +136,46 @@ class UserQuestionsBookmarked(Resource):
 class UserFollowings(Resource):
     @user_ns.doc(
         security='jwt_auth',
-        description='Get following user by user_id.'
+        description='Get following user by user_id.',
+        params=CURSOR_PARAMS
     )
     @jwt_required()
     def get(self, user_id):
-
-        try:
-            users = User.query.filter_by(id=user_id).first().followings
-        except AttributeError:
+        if not User.find_by_id(user_id):
             return {"status": 404, "message": "not found"}, http.HTTPStatus.NOT_FOUND
 
-        users_dicts = []
+        base_query = User.relationship_query(user_id, "followings")
+        if is_cursor_request():
+            return cursor_response(base_query, [user_relationship.c.created_at, User.id],
+                                   lambda x: [x.followed_at, x.User.id], User.relationship_to_dict_list)
 
-        for user in users:
-            is_following = True if current_user.is_following(user) else False
-            user_dict = user.to_dict() | {"is_following": is_following}
-            users_dicts.append(user_dict)
-
-        return users_dicts
+        objects = base_query \
+            .order_by(user_relationship.c.created_at.desc()) \
+            .all()
+        return User.relationship_to_dict_list(objects)
 
 
 @user_ns.route('/<user_id>/followers')
 class UserFollowers(Resource):
     @user_ns.doc(
         security='jwt_auth',
-        description='Get follower by user_id.'
+        description='Get follower by user_id.',
+        params=CURSOR_PARAMS
     )
     @jwt_required()
     def get(self, user_id):
-
-        try:
-            users = User.query.filter_by(id=user_id).first().follower
-        except AttributeError:
+        if not User.find_by_id(user_id):
             return {"status": 404, "message": "not found"}, 404
 
-        users_dicts = []
-
-        for user in users:
-            is_following = True if current_user.is_following(user) else False
-            user_dict = user.to_dict() | {"is_following": is_following}
-            users_dicts.append(user_dict)
+        base_query = User.relationship_query(user_id, "followers")
+        if is_cursor_request():
+            return cursor_response(base_query, [user_relationship.c.created_at, User.id],
+                                   lambda x: [x.followed_at, x.User.id], User.relationship_to_dict_list)
 
-        return users_dicts
+        objects = base_query \
+            .order_by(user_relationship.c.created_at.desc()) \
+            .all()
+        return User.relationship_to_dict_list(objects)
 
 
 @user_ns.route('/relationships')
@@ -189,8 +195,8 @@ class Relationship(Resource):
         target_user = User.query.filter_by(id=user_id).first()
         if not target_user:
             return {"status": 409, "message": "The user may has been deleted."}, 409
+        current_user.load_membership("followings", [target_user.id])
         current_user.follow(target_user)
-        current_user.create_follow_notification(target_user)
 
         db.session.commit()
         return {"status": 200, "message": f"done successfully follow the user:{user_id}"}
@@ -209,15 +215,9 @@ class Relationship(Resource):
         target_user = User.query.filter_by(id=user_id).first()
         if not target_user:
             return {"status": 409, "message": "The user may has been deleted."}, 409
+        current_user.load_membership("followings", [target_user.id])
         current_user.unfollow(target_user)
 
-        # delete notification if exist
-        Notification.query.filter_by(
-            passive_id=user_id,
-            active_id=current_user.id,
-            category=NotificationCategory.follow
-        ).delete()
-
         db.session.commit()
         return {"status": 200, "message": f"done successfully unfollow user:{user_id}"}
 
@@ -228,21 +228,29 @@ class UsersSearch(Resource):
     @user_ns.doc(
         security='jwt_auth',
         description='Search User（Finally order by desc of follower count.）',
-        body=userSearch
+        body=userSearch,
+        params=CURSOR_PARAMS
     )
     @jwt_required()
     def post(self):
         search = request.json["search"]
-        search = "%{}%".format(search)
-        users_objects = db.session.query(User, func.count(user_relationship.c.followed_id).label("follower_count")) \
-            .outerjoin(user_relationship, user_relationship.c.followed_id == User.id) \
-            .filter(User.id != current_user.id) \
-            .filter((User.username + User.nickname_replaced).like(search)) \
-            .order_by(func.count(user_relationship.c.followed_id).desc()) \
-            .group_by(User.id) \
+        if not search:
+            return []
+
+        base_query = search_user_query(search) \
+            .filter(User.id != current_user.id)
+        if is_cursor_request():
+            return cursor_response(base_query, [UserCounters.followers, User.id],
+                                   lambda x: [x.follower_count, x.User.id],
+                                   lambda x: User.to_dict_list(list(map(lambda y: y.User, x))))
+
+        users_objects = base_query \
+            .order_by(UserCounters.followers.desc()) \
+            .order_by(User.id.desc()) \
+            .limit(MAX_LIMIT) \
             .all()
 
-        return list(map(lambda x: x.User.to_dict(), users_objects))
+        return User.to_dict_list(list(map(lambda x: x.User, users_objects)))
 
 
 @user_ns.route('/search/history')
@@ -257,7 +265,7 @@ class UsersSearchHistory(Resource):
             .filter(SearchHistory.user_id == current_user.id) \
             .join(User, User.id == SearchHistory.target_id) \
             .order_by(SearchHistory.updated_at.desc()).all()
-        return list(map(lambda x: x.User.to_dict(), users_objects))
+        return User.to_dict_list(list(map(lambda x: x.User, users_objects)))
 
     @user_ns.doc(
         security='jwt_auth',
@@ -330,31 +338,7 @@ class UserPointRanking(Resource):
     )
     @jwt_required()
     def get(self):
-        period = request.args.get("period")
-
-        if period == "week":
-            select_query = [PointStats.week_rank, PointStats.week_point]
-            sub_query = PointStats.week_rank.asc()
-        elif period == "month":
-            select_query = [PointStats.month_rank, PointStats.month_point]
-            sub_query = PointStats.month_rank.asc()
-        else:  # all
-            select_query = [PointStats.total_rank, PointStats.total_point]
-            sub_query = PointStats.total_rank.asc()
-
-        objects = db.session.query(select_query[0].label("rank"), select_query[1].label("point"), User) \
-            .join(User, User.id == PointStats.user_id) \
-            .filter(select_query[0].is_not(None)) \
-            .filter(select_query[1].is_not(None)) \
-            .order_by(sub_query) \
-            .order_by(User.id.desc()) \
-            .limit(30) \
-            .all()
-
-        return list(map(lambda x: x.User.to_dict() | {
-            "rank": x.rank,
-            "point": x.point
-        }, objects))
+        return ranking_response(PointStats)
 
 
 @user_ns.route('/response_ranking')
@@ -366,31 +350,7 @@ class UserResponseRanking(Resource):
     )
     @jwt_required()
     def get(self):
-        period = request.args.get("period")
-
-        if period == "week":
-            select_query = [ResponseStats.week_rank, ResponseStats.week_response]
-            sub_query = ResponseStats.week_rank.asc()
-        elif period == "month":
-            select_query = [ResponseStats.month_rank, ResponseStats.month_response]
-            sub_query = ResponseStats.month_rank.asc()
-        else:  # all
-            select_query = [ResponseStats.total_rank, ResponseStats.total_response]
-            sub_query = ResponseStats.total_rank.asc()
-
-        objects = db.session.query(select_query[0].label("rank"), select_query[1].label("response"), User) \
-            .join(User, User.id == ResponseStats.user_id) \
-            .filter(select_query[0].is_not(None)) \
-            .filter(select_query[1].is_not(None)) \
-            .order_by(sub_query) \
-            .order_by(User.id.desc()) \
-            .limit(30) \
-            .all()
-
-        return list(map(lambda x: x.User.to_dict() | {
-            "rank": x.rank,
-            "response": x.response
-        }, objects))
+        return ranking_response(ResponseStats)
 
 
 @user_ns.route('/<user_id>/information')
@@ -407,43 +367,45 @@ class UserInformation(Resource):
             return {"message": "Not Found."}, 404
 
         period = request.args.get("period")
-        point_stats: PointStats = user.point_stats
-        response_stats: ResponseStats = user.response_stats
-        if period == "week":
-            d = {"weeks": 1}
-            if point_stats:
-                point_stats: list = point_stats.get_week
-            if response_stats:
-                response_stats: list = response_stats.get_week
-            point_users_count: int = len(PointStats.query.filter(PointStats.week_rank.is_not(None)).all())
-            response_users_count: int = len(ResponseStats.query.filter(ResponseStats.week_rank.is_not(None)).all())
-        elif period == "month":
-            d = {"days": 30}
-            if point_stats:
-                point_stats: list = point_stats.get_month
-            if response_stats:
-                response_stats: list = response_stats.get_month
-            point_users_count: int = len(PointStats.query.filter(PointStats.month_rank.is_not(None)).all())
-            response_users_count: int = len(ResponseStats.query.filter(ResponseStats.month_rank.is_not(None)).all())
-        else:  # all
-            d = {"days": 365 * 100}
-            if point_stats:
-                point_stats: list = point_stats.get_total
-            if response_stats:
-                response_stats: list = response_stats.get_total
-            point_users_count: int = len(PointStats.query.filter(PointStats.total_rank.is_not(None)).all())
-            response_users_count: int = len(ResponseStats.query.filter(ResponseStats.total_rank.is_not(None)).all())
-
-        objects = db.session.query(point.c.point.label("point")) \
-            .filter(point.c.user_id == user_id) \
-            .filter(point.c.created_at > (datetime.now() - timedelta(**d))) \
-            .all()
-        right_count = len(list(filter(lambda x: x.point == 3, objects)))
-        first_count = len(list(filter(lambda x: x.point == 1, objects)))
-        wrong_count = len(list(filter(lambda x: x.point == -3, objects)))
-        even_count = len(list(filter(lambda x: x.point == 0, objects)))
-
-        radar_data = [right_count, first_count, wrong_count, even_count]
+        if period not in RANKING_PERIODS:
+            period = "total"
+        point_users_count: int = PointStats.find_participants(period)
+        response_users_count: int = ResponseStats.find_participants(period)
+        point_stats: list or None = user.point_stats.get_period(period, point_users_count) \
+            if user.point_stats else None
+        response_stats: list or None = user.response_stats.get_period(period, response_users_count) \
+            if user.response_stats else None
+
+        # count of each result: [right, first, wrong, even] (summed from at most 30 daily rollups)
+        categories: list = list(POINT_CATEGORY_COLUMNS.values())
+        if period in RANKING_WINDOWS:
+            counts = db.session.query(*map(lambda x: func.coalesce(func.sum(point_daily.c[x]), 0), categories)) \
+                .filter(point_daily.c.user_id == user_id) \
+                .filter(point_daily.c.day > (date.today() - timedelta(**RANKING_WINDOWS[period]))) \
+                .one()
+        elif user.point_stats:
+            counts = list(map(lambda x: getattr(user.point_stats, x), categories))
+        else:
+            counts = [0] * len(categories)
+        radar_data = list(map(int, counts))
 
         return {"radar_data": radar_data, "point_stats": point_stats, "response_stats": response_stats,
                 "point_users_count": point_users_count, "response_users_count": response_users_count}, 200
+
+
+def ranking_response(stats_model):
+    """The snapshot of the ranking with the follow states of current_user. (304 if the ETag matches)"""
+    period = request.args.get("period")
+    if period not in RANKING_PERIODS:
+        period = "total"
+    snapshot = stats_model.find_snapshot(period)
+
+    # only the follow states are resolved per request.
+    current_user.load_membership("followings", list(map(lambda x: x["id"], snapshot.payload)))
+    objects = list(map(lambda x: x | {"is_following": current_user.has_membership("followings", x["id"])},
+                       snapshot.payload))
+    follow_bits = "".join(map(lambda x: "1" if x["is_following"] else "0", objects))
+    etag = f'"{snapshot.name}.{snapshot.generation}.{follow_bits}"'
+    if request.if_none_match.contains(etag.strip('"')):
+        return Response(status=304, headers={"ETag": etag})
+    return objects, 200, {"ETag": etag}
@@ -10,8 +10,8 @@ from flask_migrate import Migrate
 
 from api.admin import admin_ns
 from api.auth.auth import auth_ns
-from api.model.others import TokenBlocklist
-from api.model.user import User
+from api.libs.token_revocation import revoked_tokens
+from api.libs.user_cache import load_user
 import config
 from api.notifications import notification_ns
 from api.questions import question_ns
@@ -48,14 +48,12 @@ def user_identity_lookup(user):
 @jwt.user_lookup_loader
 def user_lookup_callback(_jwt_header, jwt_data):
     identity = jwt_data["sub"]
-    return User.query.filter_by(id=identity).one_or_none()
+    return load_user(identity)
 
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload["jti"]
-    token = db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar()
-    return token is not None
+    return revoked_tokens.is_revoked(jwt_payload["jti"], jwt_payload["type"])
 
 
 @app.route('/')
@@ -1,7 +1,11 @@
-from datetime import timedelta, datetime
-from sqlalchemy import func
-from api.model.aggregate import point, response
-from api.model.user import User, PointStats, ResponseStats
+from datetime import timedelta, datetime, date, time
+from sqlalchemy import func, bindparam, select
+from sqlalchemy.dialects.mysql import insert
+from api.model.aggregate import point_daily, response_daily, ranking_window, ranking_summary, POINT_CATEGORY_COLUMNS
+from api.model.others import user_relationship, Notification
+from api.model.question import Question, answer
+from api.model.search import index_user
+from api.model.user import User, UserCounters, PointStats, ResponseStats, RANKING_PERIODS, RANKING_WINDOWS
 from app import app
 from database import db
 
@@ -9,18 +13,132 @@ from database import db
 # * How to execute *
 $ export FLASK_APP=batch.py
 $ flask batch_execute "Batch job starting..."
+
+# * Rebuild all the ranking accumulators from the daily rollups (initialize or repair) *
+$ flask ranking_rebuild
+
+# * Count the participants and publish the rankings only (every minute by uWSGI, see app.ini) *
+$ flask ranking_refresh
+
+# * Rebuild the user search index (initialize or repair) *
+$ flask search_reindex
+
+# * Recount the user counters (repair the drift) *
+$ flask counters_reconcile
 """
 
+# {column of stats: aggregation of the daily rollup}
+POINT_VALUES: dict = dict(map(lambda x: (PointStats.get_column(x).name, func.sum(point_daily.c.point)),
+                              RANKING_PERIODS)) \
+                     | dict(map(lambda x: (x, func.sum(point_daily.c[x])), POINT_CATEGORY_COLUMNS.values()))
+RESPONSE_VALUES: dict = dict(map(lambda x: (ResponseStats.get_column(x).name, func.sum(response_daily.c.response_count)),
+                                 RANKING_PERIODS))
+
+# {column of user counters: (counted column, column of the owner user, *conditions)}
+COUNTER_SOURCES: dict = {
+    "followers": (user_relationship.c.following_id, user_relationship.c.followed_id),
+    "followings": (user_relationship.c.followed_id, user_relationship.c.following_id),
+    "questions": (Question.id, Question.user_id),
+    "answers": (answer.c.question_id, answer.c.user_id),
+    "unread_notifications": (Notification.id, Notification.passive_id, Notification.watched.is_(False)),
+}
+
 
 @app.cli.command('batch_execute')
 def batch_execute() -> None:
-    """Aggregate ranking data."""
+    """Expire the daily rollups out of the ranking windows. (sliding-window job)"""
     try:
         app.logger.info("---START---")
         db.session.begin()
         step_0()
         step_1()
         step_2()
+        step_3()
+        step_4()
+        db.session.commit()
+        app.logger.info("Finished all steps successfully.")
+    except:
+        app.logger.error("Something fatal error occurred and start rollback.")
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+        app.logger.info("---END---")
+
+
+@app.cli.command('ranking_rebuild')
+def ranking_rebuild() -> None:
+    """Rebuild all the ranking accumulators from the daily rollups."""
+    try:
+        app.logger.info("---START---")
+        db.session.begin()
+        for (stats_model, rollup_table, values) in [(PointStats, point_daily, POINT_VALUES),
+                                                    (ResponseStats, response_daily, RESPONSE_VALUES)]:
+            for period in RANKING_PERIODS:
+                rebuild_window(stats_model, rollup_table, values, period)
+        step_3()
+        step_4()
+        db.session.commit()
+        app.logger.info("Finished all steps successfully.")
+    except:
+        app.logger.error("Something fatal error occurred and start rollback.")
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+        app.logger.info("---END---")
+
+
+@app.cli.command('ranking_refresh')
+def ranking_refresh() -> None:
+    """Count the participants, and publish the snapshots of all the rankings."""
+    try:
+        app.logger.info("---START---")
+        db.session.begin()
+        step_3()
+        step_4()
+        db.session.commit()
+        app.logger.info("Finished all steps successfully.")
+    except:
+        app.logger.error("Something fatal error occurred and start rollback.")
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+        app.logger.info("---END---")
+
+
+@app.cli.command('search_reindex')
+def search_reindex() -> None:
+    """Rebuild the n-gram postings of the user search index."""
+    try:
+        app.logger.info("---START---")
+        db.session.begin()
+        for user in User.query.yield_per(1000):
+            index_user(user)
+        db.session.commit()
+        app.logger.info("Finished all steps successfully.")
+    except:
+        app.logger.error("Something fatal error occurred and start rollback.")
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+        app.logger.info("---END---")
+
+
+@app.cli.command('counters_reconcile')
+def counters_reconcile() -> None:
+    """Recount all the user counters from the source tables."""
+    try:
+        app.logger.info("---START---")
+        db.session.begin()
+        counters = UserCounters.__table__
+        db.session.execute(insert(counters).prefix_with("IGNORE").from_select(["user_id"], select(User.id)))
+        db.session.execute(counters.update().values(dict(map(
+            lambda x: (x[0], select(func.count(x[1][0])).where(x[1][1] == counters.c.user_id, *x[1][2:])
+                       .scalar_subquery()),
+            COUNTER_SOURCES.items()))))
         db.session.commit()
         app.logger.info("Finished all steps successfully.")
     except:
@@ -41,132 +159,118 @@ def step_0() -> None:
 
 
 def step_1() -> None:
-    """Firstly Aggregate data."""
+    """Expire the points out of the month/week windows."""
     app.logger.info("---Start step1---")
-    results: list[dict] = []
-    for (loop, period) in enumerate([{"days": 365 * 100}, {"days": 30}, {"days": 7}]):
-        """Point"""
-        point_entities = db.session.query(User, func.sum(point.c.point).label("points")) \
-            .join(point, point.c.user_id == User.id) \
-            .filter(point.c.created_at > (datetime.now() - timedelta(**period))) \
-            .group_by(User.id) \
-            .order_by(func.sum(point.c.point).desc()) \
-            .order_by(User.id.desc()) \
-            .all()
-
-        for (index_rank, entity) in enumerate(point_entities):
-            if loop == 0:
-                init_dict = {
-                    "user_id": entity.User.id,
-                    "total_rank": index_rank + 1,
-                    "total_point": int(entity.points),
-                    "month_rank": None,
-                    "month_point": None,
-                    "week_rank": None,
-                    "week_point": None
-                }
-                results.append(init_dict)
-            elif loop == 1:
-                month_dict = {
-                    "month_rank": index_rank + 1,
-                    "month_point": int(entity.points),
-                }
-                for (index, r) in enumerate(results):
-                    if r["user_id"] == entity.User.id:
-                        results[index] = results[index] | month_dict
-                        break
-            elif loop == 2:
-                week_dict = {
-                    "week_rank": index_rank + 1,
-                    "week_point": int(entity.points),
-                }
-                for (index, r) in enumerate(results):
-                    if r["user_id"] == entity.User.id:
-                        results[index] = results[index] | week_dict
-                        break
-    app.logger.info("Successfully collected data.")
-
-    """Finally, Update or Create records."""
-    for r in results:
-        stats = PointStats.find_by_user_id(r["user_id"])
-        # update
-        if stats:
-            stats.total_rank = r["total_rank"]
-            stats.total_point = r["total_point"]
-            stats.month_rank = r["month_rank"]
-            stats.month_point = r["month_point"]
-            stats.week_rank = r["week_rank"]
-            stats.week_point = r["week_point"]
-        # create
-        else:
-            stats = PointStats(**r)
-            db.session.add(stats)
-        db.session.flush()
-    app.logger.info("Successfully create and update data.")
+    for period in RANKING_WINDOWS:
+        expire_window(PointStats, point_daily, POINT_VALUES, period)
     app.logger.info("---End step1---")
 
 
 def step_2() -> None:
-    """Firstly Aggregate data."""
+    """Expire the responses out of the month/week windows."""
     app.logger.info("---Start step2---")
-    results: list[dict] = []
-    for (loop, period) in enumerate([{"days": 365 * 100}, {"days": 30}, {"days": 7}]):
-        """response & Answer count"""
-        response_entities = db.session.query(User, func.count(response.c.user_id).label("responses")) \
-            .join(response, response.c.user_id == User.id) \
-            .filter(response.c.created_at > (datetime.now() - timedelta(**period))) \
-            .group_by(User.id) \
-            .order_by(func.count(response.c.user_id).desc()) \
-            .order_by(User.id.desc()) \
-            .all()
-
-        for (index_rank, entity) in enumerate(response_entities):
-            if loop == 0:
-                init_dict = {
-                    "user_id": entity.User.id,
-                    "total_rank": index_rank + 1,
-                    "total_response": int(entity.responses),
-                    "month_rank": None,
-                    "month_response": None,
-                    "week_rank": None,
-                    "week_response": None
-                }
-                results.append(init_dict)
-            elif loop == 1:
-                month_dict = {
-                    "month_rank": index_rank + 1,
-                    "month_response": int(entity.responses),
-                }
-                for (index, r) in enumerate(results):
-                    if r["user_id"] == entity.User.id:
-                        results[index] = results[index] | month_dict
-                        break
-            elif loop == 2:
-                week_dict = {
-                    "week_rank": index_rank + 1,
-                    "week_response": int(entity.responses),
-                }
-                for (index, r) in enumerate(results):
-                    if r["user_id"] == entity.User.id:
-                        results[index] = results[index] | week_dict
-                        break
-    app.logger.info("Successfully collected data.")
-
-    """Finally, Update or Create records."""
-    for r in results:
-        stats = ResponseStats.find_by_user_id(r["user_id"])
-        # update
-        if stats:
-            stats.total_rank = r["total_rank"]
-            stats.total_response = r["total_response"]
-            stats.month_rank = r["month_rank"]
-            stats.month_response = r["month_response"]
-            stats.week_rank = r["week_rank"]
-            stats.week_response = r["week_response"]
-        # create
-        else:
-            stats = ResponseStats(**r)
-            db.session.add(stats)
-        db.session.flush()
-    app.logger.info("Successfully create and update data.")
+    for period in RANKING_WINDOWS:
+        expire_window(ResponseStats, response_daily, RESPONSE_VALUES, period)
     app.logger.info("---End step2---")
+
+
+def step_3() -> None:
+    """Count the participants of all the rankings."""
+    app.logger.info("---Start step3---")
+    for stats_model in [PointStats, ResponseStats]:
+        for period in RANKING_PERIODS:
+            statement = insert(ranking_summary).values(name=f"{stats_model.metric}_{period}",
+                                                       participants=stats_model.count_participants(period),
+                                                       updated_at=datetime.now())
+            statement = statement.on_duplicate_key_update(participants=statement.inserted.participants,
+                                                          updated_at=statement.inserted.updated_at)
+            db.session.execute(statement)
+    db.session.flush()
+    app.logger.info("---End step3---")
+
+
+def step_4() -> None:
+    """Publish the snapshots of all the rankings."""
+    app.logger.info("---Start step4---")
+    for stats_model in [PointStats, ResponseStats]:
+        for period in RANKING_PERIODS:
+            stats_model.publish_snapshot(period)
+    db.session.flush()
+    app.logger.info("---End step4---")
+
+
+def expire_window(stats_model, rollup_table, values: dict, period: str) -> None:
+    """Subtract only the daily rollups that left the window since the last run. (no rescan of the events)"""
+    name = f"{stats_model.metric}_{period}"
+    boundary = window_boundary(period)
+    expired_until = db.session.query(ranking_window.c.expired_until) \
+        .filter(ranking_window.c.name == name) \
+        .scalar()
+    if not expired_until:
+        app.logger.info(f"The window '{name}' is not initialized yet, so rebuild it.")
+        rebuild_window(stats_model, rollup_table, values, period)
+        return
+
+    column = stats_model.get_column(period)
+    entities = db.session.query(rollup_table.c.user_id, values[column.name].label("value")) \
+        .filter(rollup_table.c.day > expired_until.date()) \
+        .filter(rollup_table.c.day <= boundary) \
+        .group_by(rollup_table.c.user_id) \
+        .all()
+
+    if entities:
+        db.session.execute(
+            stats_model.__table__.update()
+            .where(stats_model.__table__.c.user_id == bindparam("target_user_id"))
+            .values({column: column - bindparam("expired_value")}),
+            list(map(lambda x: {"target_user_id": x.user_id, "expired_value": int(x.value)}, entities))
+        )
+    # no events left in the window.
+    db.session.execute(stats_model.__table__.update().where(column == 0).values({column: None}))
+
+    save_window(name, boundary)
+    db.session.flush()
+    app.logger.info(f"Expired the rollups of {len(entities)} users from '{name}'.")
+
+
+def rebuild_window(stats_model, rollup_table, values: dict, period: str) -> None:
+    """Recompute the accumulators of the period from the daily rollups in the window."""
+    if period in RANKING_WINDOWS:
+        column = stats_model.get_column(period)
+        values = {column.name: values[column.name]}
+    else:
+        # the total accumulator and the other total counters.
+        values = dict(filter(lambda x: x[0] not in map(lambda p: stats_model.get_column(p).name, RANKING_WINDOWS),
+                             values.items()))
+
+    query = db.session.query(rollup_table.c.user_id, *map(lambda x: x[1].label(x[0]), values.items())) \
+        .group_by(rollup_table.c.user_id)
+
+    boundary = None
+    if period in RANKING_WINDOWS:
+        boundary = window_boundary(period)
+        query = query.filter(rollup_table.c.day > boundary)
+        db.session.execute(stats_model.__table__.update().values(dict(map(lambda x: (x, None), values))))
+    entities = query.all()
+
+    for entity in entities:
+        statement = insert(stats_model.__table__).values(
+            {"user_id": entity.user_id} | dict(map(lambda x: (x, int(getattr(entity, x))), values)))
+        statement = statement.on_duplicate_key_update(dict(map(lambda x: (x, statement.inserted[x]), values)))
+        db.session.execute(statement)
+
+    if boundary:
+        save_window(f"{stats_model.metric}_{period}", boundary)
+    db.session.flush()
+    app.logger.info(f"Rebuilt '{stats_model.metric}_{period}' of {len(entities)} users.")
+
+
+def window_boundary(period: str) -> date:
+    """The window of the period is the days after this. (ex: week is today and the 6 days before.)"""
+    return date.today() - timedelta(**RANKING_WINDOWS[period])
+
+
+def save_window(name: str, boundary: date) -> None:
+    statement = insert(ranking_window).values(name=name, expired_until=datetime.combine(boundary, time()))
+    statement = statement.on_duplicate_key_update(expired_until=statement.inserted.expired_until)
+    db.session.execute(statement)
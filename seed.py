@@ -1,11 +1,14 @@
 from faker import Faker
 from sqlalchemy import text
 
-from api.model.aggregate import point
+from api.libs.outbox_worker import drain_outbox
+from api.model.aggregate import record_point
 from api.model.confirmation import Confirmation
 from api.model.enum.enums import UserRole
 from api.model.question import Question
-from api.model.user import User
+from api.model.search import index_user
+from api.model.timeline import fan_out_question
+from api.model.user import User, PointStats
 from app import app
 from database import db
 
@@ -47,8 +50,9 @@ def seed_execute() -> None:
             user.role = role
             db.session.add(user)
             db.session.flush()
+            index_user(user)
             confirmation = Confirmation(user.id)
-            confirmation.confirmed = True
+            user.confirm(confirmation)
             db.session.add(confirmation)
             db.session.flush()
             test_users.append(user)
@@ -72,17 +76,15 @@ def seed_execute() -> None:
             user.role = role
             db.session.add(user)
             db.session.flush()
+            index_user(user)
             confirmation = Confirmation(user.id)
-            confirmation.confirmed = True
+            user.confirm(confirmation)
             db.session.add(confirmation)
             db.session.flush()
 
             # insert point
-            insert_point = point.insert().values(
-                user_id=user.id,
-                point=3
-            )
-            db.session.execute(insert_point)
+            record_point(user.id, 3)
+            PointStats.apply(user.id, 3)
 
         """Admin user"""
         username = 'jack'
@@ -100,8 +102,9 @@ def seed_execute() -> None:
         user.role = role
         db.session.add(user)
         db.session.flush()
+        index_user(user)
         confirmation = Confirmation(user.id)
-        confirmation.confirmed = True
+        user.confirm(confirmation)
         db.session.add(confirmation)
         db.session.flush()
 
@@ -123,7 +126,12 @@ def seed_execute() -> None:
             )
             db.session.add(question)
             db.session.flush()
+            fan_out_question(question)
         db.session.commit()
+
+        # counters, timelines and notifications of the follows.
+        while drain_outbox():
+            pass
         app.logger.info("Successfully created data.")
     except:
         app.logger.error("Something fatal error occurred and start rollback.")
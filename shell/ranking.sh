@@ -0,0 +1,5 @@
+#!/bin/bash
+
+cd "$(dirname "$0")/.." || exit 1
+export FLASK_APP=batch.py
+exec flask ranking_refresh
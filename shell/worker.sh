@@ -0,0 +1,5 @@
+#!/bin/bash
+
+cd "$(dirname "$0")/.." || exit 1
+export FLASK_APP=worker.py
+exec flask outbox_worker
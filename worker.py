@@ -0,0 +1,75 @@
+from time import sleep
+
+from api.libs.outbox_worker import drain_outbox, drain_email_outbox, drain_object_deletions
+from api.model.outbox import revive_events
+from app import app
+from database import db
+
+"""
+# * How to execute *
+$ export FLASK_APP=worker.py
+$ flask outbox_worker
+
+# * Drain the events once and exit *
+$ flask outbox_drain
+
+# * Retry the dead events (failed OUTBOX_MAX_ATTEMPTS times) *
+$ flask outbox_revive
+"""
+
+
+@app.cli.command('outbox_worker')
+def outbox_worker() -> None:
+    """Keep draining the outbox events, emails and object deletions."""
+    app.logger.info("---START---")
+    try:
+        while True:
+            try:
+                event_count = drain_outbox()
+                email_count = drain_email_outbox()
+                deletion_count = drain_object_deletions()
+                if event_count < app.config['OUTBOX_BATCH_SIZE'] \
+                        and email_count < app.config['EMAIL_OUTBOX_BATCH_SIZE'] \
+                        and deletion_count < app.config['OBJECT_DELETION_BATCH_SIZE']:
+                    sleep(app.config['OUTBOX_POLL_SECONDS'])
+            except Exception:
+                app.logger.exception("Something fatal error occurred and retry after a while.")
+                db.session.rollback()
+                sleep(app.config['OUTBOX_POLL_SECONDS'])
+            finally:
+                db.session.remove()
+    finally:
+        app.logger.info("---END---")
+
+
+@app.cli.command('outbox_drain')
+def outbox_drain() -> None:
+    """Drain all the outbox events, emails and object deletions, and exit."""
+    try:
+        app.logger.info("---START---")
+        count = 0
+        while processed := drain_outbox():
+            count += processed
+        email_count = 0
+        while processed := drain_email_outbox():
+            email_count += processed
+        deletion_count = 0
+        while processed := drain_object_deletions():
+            deletion_count += processed
+        app.logger.info(f"Handled {count} events, {email_count} emails and {deletion_count} object deletions.")
+    finally:
+        db.session.close()
+        app.logger.info("---END---")
+
+
+@app.cli.command('outbox_revive')
+def outbox_revive() -> None:
+    """Make the dead events claimable again. (after fixing the cause)"""
+    try:
+        app.logger.info("---START---")
+        count = revive_events()
+        db.session.commit()
+        app.logger.info(f"Revived {count} events.")
+    finally:
+        db.session.close()
+        app.logger.info("---END---")